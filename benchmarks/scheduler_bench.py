@@ -0,0 +1,93 @@
+"""
+Scheduler benchmark: memory per pending post and fire-time accuracy.
+
+Runs PostScheduler from helper_func with in-memory no-ops injected in place
+of the Mongo callbacks (no pyrogram or database needed) and compares it
+with the old one-sleeping-task-per-post design.
+
+    python benchmarks/scheduler_bench.py [--posts 100000] [--fire 2000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper_func import PostScheduler
+
+due = {}
+lateness = []
+
+async def send_scheduled_post(client, post_id):
+    lateness.append(time.time() - due[post_id])
+
+async def get_due_posts(until, limit=0, exclude=()):
+    return []
+
+async def renew_post_leases(post_ids):
+    return 0
+
+async def requeue_expired_posts():
+    return 0
+
+async def heap_bench(posts, fire):
+    scheduler = PostScheduler(send_scheduled_post, get_due_posts, renew_post_leases, requeue_expired_posts)
+    scheduler._horizon = float('inf')  # keep every post in memory, as the old design did
+    
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    now = time.time()
+    started = time.perf_counter()
+    for i in range(posts):
+        scheduler.add(f"post_{i}", now + 3600 + i)
+    insert = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    
+    started = time.perf_counter()
+    for i in range(0, posts, 2):
+        scheduler.cancel(f"post_{i}")
+    cancel = time.perf_counter() - started
+    
+    print(f"heap dispatcher: {memory / posts:.0f} B/post ({memory / 1e6:.1f} MB), "
+          f"insert {posts} in {insert:.3f}s, cancel {posts // 2} in {cancel:.3f}s")
+    
+    # Fire accuracy: posts due over the next ~fire ms, on top of the pending load
+    scheduler.start(None)
+    now = time.time()
+    for i in range(fire):
+        post_id = f"fire_{i}"
+        due[post_id] = now + 0.2 + i * 0.001
+        scheduler.add(post_id, due[post_id])
+    await asyncio.sleep(0.5 + fire * 0.001)
+    
+    ordered = sorted(lateness)
+    print(f"fire lateness over {len(ordered)} posts: p50 {ordered[len(ordered) // 2] * 1000:.2f} ms, "
+          f"p99 {ordered[int(len(ordered) * 0.99)] * 1000:.2f} ms, max {ordered[-1] * 1000:.2f} ms")
+
+async def task_bench(posts):
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    tasks = [asyncio.create_task(asyncio.sleep(3600 + i)) for i in range(posts)]
+    await asyncio.sleep(0)
+    memory = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    print(f"task-per-post:   {memory / posts:.0f} B/post ({memory / 1e6:.1f} MB)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--posts', type=int, default=100_000)
+    parser.add_argument('--fire', type=int, default=2000)
+    args = parser.parse_args()
+    
+    asyncio.run(heap_bench(args.posts, args.fire))
+    asyncio.run(task_bench(args.posts))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+split_file benchmark: wall time and peak RSS, old read()/write() vs current.
+
+Each implementation runs in its own subprocess so ru_maxrss is not shared.
+The old version read a whole part (up to max_size) into memory at once;
+the current one copies in the kernel with copy_file_range/sendfile.
+
+    python benchmarks/split_file_bench.py [--size-mb 2048] [--part-mb 700] [--dir /tmp]
+"""
+import argparse
+import glob
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def legacy_split_file(file_path, max_size):
+    """split_file as it was before kernel-side copies"""
+    chunks = []
+    chunk_num = 1
+    p = Path(file_path)
+    with open(file_path, 'rb') as input_file:
+        while True:
+            chunk_data = input_file.read(int(max_size))
+            if not chunk_data:
+                break
+            output_file = p.parent / f"{p.stem}.part{chunk_num:03d}{p.suffix}"
+            with open(output_file, 'wb') as output_chunk:
+                output_chunk.write(chunk_data)
+            chunks.append(str(output_file))
+            chunk_num += 1
+    return chunks
+
+def run_one(variant, file_path, max_size):
+    """Child process: split once and report time and peak RSS"""
+    if variant == "old":
+        split = legacy_split_file
+    else:
+        from helper_func import split_file as split
+
+    started = time.perf_counter()
+    parts = split(file_path, max_size=max_size)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    for part in parts:
+        if part != file_path:
+            os.remove(part)
+    print(f"RESULT {variant}: {len(parts)} parts in {elapsed:.2f}s, peak RSS {peak:.0f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size-mb', type=int, default=2048)
+    parser.add_argument('--part-mb', type=int, default=700)
+    parser.add_argument('--dir', default=tempfile.gettempdir())
+    parser.add_argument('--run', choices=("old", "new"), help=argparse.SUPPRESS)
+    parser.add_argument('--file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    max_size = args.part_mb * 1024 * 1024
+
+    if args.run:
+        run_one(args.run, args.file, max_size)
+        return
+
+    file_path = os.path.join(args.dir, "split_bench.bin")
+    with open(file_path, 'wb') as output:
+        block = os.urandom(16 * 1024 * 1024)
+        for _ in range(args.size_mb // 16):
+            output.write(block)
+
+    try:
+        for variant in ("old", "new"):
+            result = subprocess.run(
+                [sys.executable, __file__, '--run', variant, '--file', file_path,
+                 '--part-mb', str(args.part_mb)],
+                capture_output=True, text=True
+            )
+            lines = [line for line in result.stdout.splitlines() if line.startswith("RESULT")]
+            print(lines[-1][7:] if lines else f"{variant} failed: {result.stderr.strip()}")
+    finally:
+        for path in glob.glob(os.path.join(args.dir, "split_bench.*")):
+            os.remove(path)
+
+if __name__ == "__main__":
+    main()
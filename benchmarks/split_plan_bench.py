@@ -0,0 +1,78 @@
+"""
+Split planning benchmark: plan_split_points on synthetic packet indexes.
+
+Builds a VBR packet index like ffprobe would return for a 2 h 30 fps video
+with AAC audio, then compares the keyframe-aware plan with the old
+equal-duration split (parts over the limit are re-split, costing a pass).
+
+    python benchmarks/split_plan_bench.py [--sizes 4 6 12] [--duration 7200]
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper_func import plan_split_points
+
+MAX_SIZE = 1.95 * 1024 * 1024 * 1024
+GB = 1024 ** 3
+
+def synthetic_packets(total_bytes, duration, fps=30, audio_rate=47, seed=1):
+    """(pts, size, is_keyframe) for video with 2 s GOPs and bitrate swinging between 10-minute scenes"""
+    rnd = random.Random(seed)
+    frames = duration * fps
+    scenes = [rnd.uniform(0.2, 4) for _ in range(duration // 600 + 1)]
+    weights = [scenes[i // (fps * 600)] * (8 if i % (fps * 2) == 0 else 1) for i in range(frames)]
+    video_bytes = total_bytes * 0.95 / sum(weights)
+    audio_packets = duration * audio_rate
+    audio_size = int(total_bytes * 0.05 / audio_packets)
+
+    packets = []
+    audio = 0
+    for i in range(frames):
+        pts = i / fps
+        packets.append((pts, int(video_bytes * weights[i]), i % (fps * 2) == 0))
+        while audio < audio_packets and audio / audio_rate <= pts:
+            packets.append((audio / audio_rate, audio_size, False))
+            audio += 1
+    return packets
+
+def part_sizes(packets, cut_points):
+    """Bytes per part when cutting at cut_points"""
+    bounds = list(cut_points) + [float('inf')]
+    sizes = [0] * len(bounds)
+    index = 0
+    for pts, size, _ in sorted(packets):
+        while pts >= bounds[index]:
+            index += 1
+        sizes[index] += size
+    return sizes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[4, 6, 12], help="file sizes in GB")
+    parser.add_argument('--duration', type=int, default=7200, help="video length in seconds")
+    args = parser.parse_args()
+
+    for gb in args.sizes:
+        packets = synthetic_packets(gb * GB, args.duration)
+
+        started = time.perf_counter()
+        cut_points = plan_split_points(packets, MAX_SIZE)
+        elapsed = time.perf_counter() - started
+        planned = part_sizes(packets, cut_points or [])
+
+        num_parts = math.ceil(gb * GB / MAX_SIZE)
+        even = part_sizes(packets, [args.duration / num_parts * i for i in range(1, num_parts)])
+        oversized = sum(size > MAX_SIZE for size in even)
+
+        print(f"{gb:g} GB, {len(packets)} packets: plan {elapsed * 1000:.0f} ms, "
+              f"{len(planned)} parts, largest {max(planned) / GB:.3f} GB | "
+              f"even split: {num_parts} parts, largest {max(even) / GB:.3f} GB, {oversized} over the limit")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,18 @@
 import os
 import time
 import asyncio
+import json
+import random
+import uuid
 from datetime import datetime, timedelta
 import pytz
 from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.enums import ParseMode
+from pyrogram.errors import FloodWait, BadRequest, Forbidden, Unauthorized
+from bson.codec_options import CodecOptions
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
 from database import *
 from helper_func import *
 
@@ -13,8 +20,24 @@ from helper_func import *
 IST = pytz.timezone('Asia/Kolkata')
 
 # Global storage
-scheduler_tasks = {}
-pending_forwards = {}
+def create_session_backend():
+    """Pick the write-through backend for conversation sessions"""
+    if Config.SESSION_BACKEND == 'redis':
+        try:
+            return RedisSessionBackend(Config.REDIS_URL)
+        except ImportError:
+            print("⚠️ redis package not installed, falling back to Mongo sessions")
+    if Config.SESSION_BACKEND in ('redis', 'mongo'):
+        # tz-aware codec so schedule times come back in IST
+        return MongoSessionBackend(conversation_sessions.with_options(
+            codec_options=CodecOptions(tz_aware=True, tzinfo=IST)
+        ))
+    return None
+
+pending_forwards = SessionStore(Config.SESSION_TIMEOUT, Config.SESSION_MAX_ENTRIES, create_session_backend())
+collection_ack_tasks = {}  # user_id -> latest pending acknowledgement task
+collection_ack_sending = {}  # user_id -> task currently posting/editing the status message
+collection_ack_locks = {}  # user_id -> lock serialising status message sends
 
 # from admin_state import admin_conversations
 
@@ -22,14 +45,83 @@ pending_forwards = {}
 
 from database import settings_data
 
+class ChannelCache:
+    """
+    Process-local copy of the saved_channels document.
+    Writes go to Mongo first and the returned document replaces the cache,
+    so reads never touch the database. Every write bumps a _version field;
+    a background check compares it to detect changes made by other replicas.
+    """
+    
+    def __init__(self):
+        self._channels = {}
+        self._version = None
+        self._task = None
+    
+    def _apply(self, document):
+        """Replace the cached channels with a saved_channels document"""
+        document = document or {}
+        self._version = document.get('_version', 0)
+        self._channels = {
+            key: value for key, value in document.items()
+            if key not in ('_id', '_version')
+        }
+    
+    @property
+    def loaded(self):
+        return self._version is not None
+    
+    def get(self):
+        """Snapshot of saved channels as {str(channel_id): name}"""
+        return dict(self._channels)
+    
+    async def load(self):
+        """Load the saved channels from the database"""
+        try:
+            self._apply(await settings_data.find_one({'_id': 'saved_channels'}))
+            return len(self._channels)
+        except Exception as e:
+            print(f"❌ Error loading channel cache: {e}")
+            return 0
+    
+    async def update(self, update: dict):
+        """Apply an update in Mongo and cache the resulting document"""
+        update.setdefault('$inc', {})['_version'] = 1
+        document = await settings_data.find_one_and_update(
+            {'_id': 'saved_channels'},
+            update,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._apply(document)
+    
+    async def check_version(self):
+        """Reload if another replica changed the saved channels"""
+        try:
+            document = await settings_data.find_one({'_id': 'saved_channels'}, {'_version': 1})
+            version = (document or {}).get('_version', 0)
+            if version != self._version:
+                await self.load()
+                print(f"🔄 Saved channels changed elsewhere, reloaded (version {self._version})")
+        except Exception as e:
+            print(f"❌ Error checking channel cache version: {e}")
+    
+    def start(self):
+        """Start the periodic version check"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._watch())
+    
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(Config.CHANNEL_CACHE_CHECK_INTERVAL)
+            await self.check_version()
+
+channel_cache = ChannelCache()
+
 async def save_channel(channel_id: int, channel_name: str):
     """Save channel to database"""
     try:
-        await settings_data.update_one(
-            {'_id': 'saved_channels'},
-            {'$set': {str(channel_id): channel_name}},
-            upsert=True
-        )
+        await channel_cache.update({'$set': {str(channel_id): channel_name}})
         print(f"✅ Channel saved: {channel_name} ({channel_id})")
         return True
     except Exception as e:
@@ -38,10 +130,9 @@ async def save_channel(channel_id: int, channel_name: str):
 
 
 async def get_saved_channels():
-    """Get saved channels from database"""
+    """Get saved channels (served from the in-memory cache)"""
     try:
-        channels = await settings_data.find_one({'_id': 'saved_channels'})
-        return channels if channels else {}
+        return channel_cache.get()
     except Exception as e:
         print(f"❌ Error getting channels: {e}")
         return {}
@@ -49,28 +140,118 @@ async def get_saved_channels():
 async def remove_channel(channel_id: int):
     """Remove channel from database"""
     try:
-        await settings_data.update_one(
-            {'_id': 'saved_channels'},
-            {'$unset': {str(channel_id): ""}}
-        )
+        await channel_cache.update({'$unset': {str(channel_id): ""}})
         return True
     except Exception as e:
         print(f"❌ Error removing channel: {e}")
         return False
 
+# ==================== SEND RATE LIMITING ====================
+
+global_send_bucket = TokenBucket(Config.GLOBAL_SEND_RATE, Config.GLOBAL_SEND_BURST)
+chat_send_buckets = {}
+chat_paused_until = {}  # chat_id -> monotonic time a FloodWait lifts
+
+# Errors that will not go away by retrying the same request
+PERMANENT_SEND_ERRORS = (BadRequest, Forbidden, Unauthorized)
+
+async def acquire_send_slot(chat_id: int, count: int = 1):
+    """Wait for both the per-chat and the global send budget (one token per message)"""
+    while True:
+        paused = chat_paused_until.get(chat_id, 0) - time.monotonic()
+        if paused <= 0:
+            break
+        await asyncio.sleep(paused)
+    
+    bucket = chat_send_buckets.get(chat_id)
+    if bucket is None:
+        bucket = chat_send_buckets[chat_id] = TokenBucket(Config.CHAT_SEND_RATE, Config.CHAT_SEND_BURST)
+    await bucket.acquire(count)
+    await global_send_bucket.acquire(count)
+
+def pause_chat(chat_id: int, seconds: float):
+    """Hold back sends to one chat without slowing any other chat"""
+    until = time.monotonic() + seconds
+    if until > chat_paused_until.get(chat_id, 0):
+        chat_paused_until[chat_id] = until
+
+async def forward_with_retry(client: Client, chat_id: int, from_chat_id: int, message_ids, post_id: str = None):
+    """
+    Forward messages, honouring FloodWait and retrying transient errors.
+    Permanent failures and exhausted retries go to the dead-letter store.
+    Returns True when the messages were delivered.
+    """
+    count = len(message_ids) if isinstance(message_ids, list) else 1
+    attempt = 0
+    
+    while True:
+        await acquire_send_slot(chat_id, count)
+        try:
+            await client.forward_messages(
+                chat_id=chat_id,
+                from_chat_id=from_chat_id,
+                message_ids=message_ids
+            )
+            return True
+        
+        except FloodWait as e:
+            # Telegram tells us exactly how long this chat is throttled
+            print(f"⏳ FloodWait {e.value}s for chat {chat_id}")
+            pause_chat(chat_id, e.value)
+            continue
+        
+        except PERMANENT_SEND_ERRORS as e:
+            error = e
+        
+        except Exception as e:
+            error = e
+            attempt += 1
+            if attempt < Config.SEND_MAX_RETRIES:
+                # Full jitter: spread retries so channels don't hammer in lockstep
+                backoff = min(Config.SEND_RETRY_MAX_DELAY, Config.SEND_RETRY_BASE_DELAY * (2 ** attempt))
+                delay = random.uniform(0, backoff)
+                print(f"⚠️ Send to {chat_id} failed ({e}), retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+        
+        await add_dead_letter({
+            'post_id': post_id,
+            'chat_id': chat_id,
+            'from_chat_id': from_chat_id,
+            'message_ids': message_ids,
+            'error': f"{type(error).__name__}: {error}",
+            'attempts': attempt + 1
+        })
+        return False
+
 # ==================== POST SCHEDULER FUNCTIONS ====================
 
+def fire_timestamp(value):
+    """UNIX timestamp for a stored fire_at (Mongo returns naive UTC datetimes)"""
+    if value.tzinfo is None:
+        value = pytz.utc.localize(value)
+    return value.timestamp()
+
+def build_post_document(post_id: str, post_data: dict):
+    """Build the scheduled_posts document for a post"""
+    fire_at = datetime.fromisoformat(post_data['schedule_time'])
+    if fire_at.tzinfo is None:
+        fire_at = IST.localize(fire_at)
+    
+    return {
+        'post_id': post_id,
+        'post_data': post_data,
+        'fire_at': fire_at,
+        'created_at': datetime.now(IST),
+        'status': 'scheduled'
+    }
+
 async def store_scheduled_post(post_id: str, post_data: dict):
     """Store scheduled post in database"""
     try:
-        await settings_data.update_one(
-            {'_id': f'scheduled_post_{post_id}'},
-            {'$set': {
-                'post_id': post_id,
-                'post_data': post_data,
-                'created_at': datetime.now(IST),
-                'status': 'scheduled'
-            }},
+        await scheduled_posts.update_one(
+            {'_id': post_id},
+            {'$set': build_post_document(post_id, post_data)},
             upsert=True
         )
         return True
@@ -78,28 +259,152 @@ async def store_scheduled_post(post_id: str, post_data: dict):
         print(f"❌ Error storing scheduled post: {e}")
         return False
 
-async def get_scheduled_posts():
-    """Get all scheduled posts from database"""
+async def get_scheduled_posts(limit: int = 0):
+    """Get scheduled posts from database, soonest first"""
     try:
         posts = []
-        async for post in settings_data.find({'_id': {'$regex': '^scheduled_post_'}}):
+        async for post in scheduled_posts.find({'status': 'scheduled'}).sort('fire_at', 1).limit(limit):
             posts.append(post)
         return posts
     except Exception as e:
         print(f"❌ Error getting scheduled posts: {e}")
         return []
 
+async def count_scheduled_posts():
+    try:
+        return await scheduled_posts.count_documents({'status': 'scheduled'})
+    except Exception as e:
+        print(f"❌ Error counting scheduled posts: {e}")
+        return 0
+
+async def get_due_posts(until: float, limit: int = 0, exclude=()):
+    """Get IDs and fire times of posts due before a UNIX timestamp (index range scan)"""
+    try:
+        posts = []
+        query = {'status': 'scheduled', 'fire_at': {'$lt': datetime.fromtimestamp(until, pytz.utc)}}
+        if exclude:
+            query['_id'] = {'$nin': list(exclude)}
+        cursor = scheduled_posts.find(query, {'fire_at': 1}).sort('fire_at', 1).limit(limit)
+        async for post in cursor:
+            posts.append({'_id': post['_id'], 'fire_at': fire_timestamp(post['fire_at'])})
+        return posts
+    except Exception as e:
+        print(f"❌ Error getting due posts: {e}")
+        return []
+
+async def get_scheduled_post(post_id: str):
+    """Get a single scheduled post from database"""
+    try:
+        return await scheduled_posts.find_one({'_id': post_id})
+    except Exception as e:
+        print(f"❌ Error getting scheduled post {post_id}: {e}")
+        return None
+
+async def claim_scheduled_post(post_id: str):
+    """
+    Atomically claim a post for this replica and return it.
+    A post is claimable when it is scheduled, or when the replica sending
+    it stopped renewing its lease.
+    """
+    try:
+        now = datetime.now(IST)
+        return await scheduled_posts.find_one_and_update(
+            {'_id': post_id, '$or': [
+                {'status': 'scheduled'},
+                {'status': 'sending', 'lease_until': {'$not': {'$gte': now}}}
+            ]},
+            {'$set': {
+                'status': 'sending',
+                'claimed_by': Config.REPLICA_ID,
+                'sending_since': now,
+                'lease_until': now + timedelta(seconds=Config.SCHEDULER_LEASE_SECONDS)
+            }}
+        )
+    except Exception as e:
+        print(f"❌ Error claiming scheduled post {post_id}: {e}")
+        return None
+
+async def renew_post_leases(post_ids: list):
+    """Extend the leases this replica holds on posts it is still sending"""
+    try:
+        await scheduled_posts.update_many(
+            {'_id': {'$in': post_ids}, 'status': 'sending', 'claimed_by': Config.REPLICA_ID},
+            {'$set': {'lease_until': datetime.now(IST) + timedelta(seconds=Config.SCHEDULER_LEASE_SECONDS)}}
+        )
+        return True
+    except Exception as e:
+        print(f"❌ Error renewing post leases: {e}")
+        return False
+
+async def requeue_expired_posts():
+    """Put posts whose sender died (lease expired) back in the queue"""
+    try:
+        result = await scheduled_posts.update_many(
+            {'status': 'sending', 'lease_until': {'$not': {'$gte': datetime.now(IST)}}},
+            {'$set': {'status': 'scheduled'}, '$unset': {'claimed_by': '', 'lease_until': ''}}
+        )
+        if result.modified_count:
+            print(f"🔁 Resuming {result.modified_count} interrupted posts")
+        return result.modified_count
+    except Exception as e:
+        print(f"❌ Error requeueing interrupted posts: {e}")
+        return 0
+
+async def advance_recurring_post(post_id: str, next_fire: datetime):
+    """Release a recurring post and move it to its next occurrence"""
+    try:
+        result = await scheduled_posts.update_one(
+            {'_id': post_id, 'status': 'sending', 'claimed_by': Config.REPLICA_ID},
+            {
+                '$set': {
+                    'status': 'scheduled',
+                    'fire_at': next_fire,
+                    'post_data.schedule_time': next_fire.isoformat(),
+                    'last_run_at': datetime.now(IST)
+                },
+                '$unset': {'claimed_by': '', 'lease_until': ''},
+                '$inc': {'run_count': 1}
+            }
+        )
+        return result.modified_count == 1
+    except Exception as e:
+        print(f"❌ Error advancing recurring post {post_id}: {e}")
+        return False
+
 async def remove_scheduled_post(post_id: str):
     """Remove scheduled post from database"""
     try:
-        await settings_data.delete_one({'_id': f'scheduled_post_{post_id}'})
+        await scheduled_posts.delete_one({'_id': post_id})
+        await clear_delivery_ledger(post_id, all_runs=True)
         return True
     except Exception as e:
         print(f"❌ Error removing scheduled post: {e}")
         return False
 
-async def schedule_post(client: Client, messages: list, channels: list, schedule_time: datetime):
-    """Schedule posts to be sent to multiple channels"""
+async def migrate_scheduled_posts():
+    """Move legacy scheduled_post_<id> documents out of the settings collection"""
+    try:
+        migrated = 0
+        async for post in settings_data.find({'_id': {'$regex': '^scheduled_post_'}}):
+            post_data = post.get('post_data', {})
+            post_id = post_data.get('post_id') or post.get('post_id')
+            
+            if post_id and post_data.get('schedule_time'):
+                if not await store_scheduled_post(post_id, post_data):
+                    continue
+                migrated += 1
+            
+            await settings_data.delete_one({'_id': post['_id']})
+        
+        if migrated:
+            print(f"✅ Migrated {migrated} scheduled posts to the scheduled_posts collection")
+        return migrated
+    except Exception as e:
+        print(f"❌ Error migrating scheduled posts: {e}")
+        return 0
+
+async def schedule_post(client: Client, messages: list, channels: list, schedule_time: datetime, recurrence: dict = None):
+    """Schedule posts to be sent to multiple channels (optionally repeating)"""
     try:
         # Convert to IST if not already
         if schedule_time.tzinfo is None:
@@ -107,6 +412,12 @@ async def schedule_post(client: Client, messages: list, channels: list, schedule
         else:
             schedule_time = schedule_time.astimezone(IST)
         
+        # /recurring picks the first run when the command is typed; if that
+        # slot passed while the admin was selecting, start at the next one
+        now = datetime.now(IST)
+        if recurrence and schedule_time <= now:
+            schedule_time = next_recurrence_time(recurrence, schedule_time, now)
+        
         # Generate unique post ID
         post_id = f"post_{int(datetime.now(IST).timestamp())}"
         
@@ -118,27 +429,21 @@ async def schedule_post(client: Client, messages: list, channels: list, schedule
             'messages': messages,
             'created_at': datetime.now(IST).isoformat()
         }
+        if recurrence:
+            post_data['recurrence'] = recurrence
         
         # Store in database
         success = await store_scheduled_post(post_id, post_data)
         
         if success:
-            # Calculate delay in seconds
-            now = datetime.now(IST)
-            delay = (schedule_time - now).total_seconds()
+            # Hand the post over to the dispatcher; a time that has already
+            # passed fires right away, but still through claim_scheduled_post
+            # so the poll (here or on another replica) can't send it twice
+            post_scheduler.start(client)
+            post_scheduler.add(post_id, min(schedule_time.timestamp(), time.time()))
             
-            if delay > 0:
-                # Create scheduled task
-                task = asyncio.create_task(send_scheduled_post(client, post_id, post_data, delay))
-                scheduler_tasks[post_id] = task
-                
-                print(f"✅ Post scheduled: {post_id} for {schedule_time.strftime('%Y-%m-%d %H:%M:%S IST')}")
-                return post_id
-            else:
-                # Send immediately if time has passed
-                await execute_scheduled_post(client, post_data)
-                await remove_scheduled_post(post_id)
-                return post_id
+            print(f"✅ Post scheduled: {post_id} for {schedule_time.strftime('%Y-%m-%d %H:%M:%S IST')}")
+            return post_id
         
         return None
         
@@ -146,19 +451,42 @@ async def schedule_post(client: Client, messages: list, channels: list, schedule
         print(f"❌ Error scheduling post: {e}")
         return None
 
-async def send_scheduled_post(client: Client, post_id: str, post_data: dict, delay: float):
-    """Send scheduled post after delay"""
+async def send_scheduled_post(client: Client, post_id: str):
+    """Send a due scheduled post (called by the dispatcher)"""
     try:
-        # Wait for the scheduled time
-        await asyncio.sleep(delay)
+        # Post data is loaded at fire time so the queue only holds IDs.
+        # Marking it 'sending' keeps it out of later window queries.
+        post = await claim_scheduled_post(post_id)
+        if not post:
+            print(f"⚠️ Scheduled post {post_id} was cancelled or claimed by another replica")
+            return
         
         # Execute the post
+        post_data = post.get('post_data', {})
         await execute_scheduled_post(client, post_data)
         
+        recurrence = post_data.get('recurrence')
+        if recurrence:
+            # Recurring posts stay in one document; just move fire_at forward
+            last_fire = post['fire_at']
+            if last_fire.tzinfo is None:
+                last_fire = pytz.utc.localize(last_fire)
+            try:
+                next_fire = next_recurrence_time(recurrence, last_fire.astimezone(IST), datetime.now(IST))
+            except ValueError as e:
+                # Don't leave it in 'sending' to be re-claimed after every lease expiry
+                print(f"❌ Recurring post {post_id} has no next run ({e}), removing it")
+                await remove_scheduled_post(post_id)
+                return
+            
+            if await advance_recurring_post(post_id, next_fire):
+                await clear_delivery_ledger(ledger_key(post_data))
+                post_scheduler.add(post_id, next_fire.timestamp())
+                print(f"🔁 Recurring post {post_id} sent, next run {next_fire.strftime('%Y-%m-%d %H:%M:%S IST')}")
+            return
+        
         # Clean up
         await remove_scheduled_post(post_id)
-        if post_id in scheduler_tasks:
-            del scheduler_tasks[post_id]
         
         print(f"✅ Scheduled post {post_id} sent successfully")
         
@@ -167,78 +495,110 @@ async def send_scheduled_post(client: Client, post_id: str, post_data: dict, del
     except Exception as e:
         print(f"❌ Error sending scheduled post {post_id}: {e}")
 
+# The single dispatcher for every scheduled post
+post_scheduler = PostScheduler(send_scheduled_post, get_due_posts, renew_post_leases, requeue_expired_posts)
+
+def ledger_key(post_data: dict):
+    """Delivery ledger key: the post ID, plus the occurrence for recurring posts"""
+    post_id = post_data.get('post_id')
+    if post_id and post_data.get('recurrence'):
+        return f"{post_id}@{post_data.get('schedule_time')}"
+    return post_id
+
 async def execute_scheduled_post(client: Client, post_data: dict):
-    """Execute the actual posting to channels"""
+    """Execute the actual posting to channels (all channels concurrently)"""
     try:
+        post_id = post_data.get('post_id')
         channels = post_data.get('channels', [])
         messages = post_data.get('messages', [])
+        run_id = ledger_key(post_data)
+        
+        # Batches already in the ledger were sent before a restart
+        batches = build_forward_batches(messages)
+        completed = await get_completed_batches(run_id) if run_id else set()
+        remaining = len(batches) * len(channels) - len(completed)
+        if completed:
+            print(f"🔁 Resuming post {post_id}: {remaining} of {len(batches) * len(channels)} batches left")
+        
+        start_time = time.monotonic()
+        await asyncio.gather(*(
+            deliver_to_channel(client, channel_id, batches, post_id, completed, run_id)
+            for channel_id in channels
+        ))
+        elapsed = time.monotonic() - start_time
         
-        for channel_id in channels:
+        print(f"⏱️ Post {post_id} delivered to {len(channels)} channels in {elapsed:.2f}s")
+        return elapsed
+        
+    except Exception as e:
+        print(f"❌ Error executing scheduled post: {e}")
+        return None
+
+# Telegram accepts at most 100 message IDs per forward_messages call
+FORWARD_BATCH_SIZE = 100
+
+def build_forward_batches(messages: list):
+    """
+    Group a post's messages into (from_chat_id, [message_ids]) batches.
+    Consecutive messages from the same chat share a batch, order is kept,
+    and an album is never split across two batches.
+    """
+    units = []
+    albums = {}
+    
+    for msg_data in messages:
+        message_id = msg_data.get('message_id')
+        original_chat_id = msg_data.get('original_chat_id')
+        if not message_id or not original_chat_id:
+            continue
+        
+        group_id = msg_data.get('media_group_id')
+        if group_id:
+            if group_id in albums:
+                albums[group_id][1].append(message_id)
+                continue
+            albums[group_id] = (original_chat_id, [message_id])
+            units.append(albums[group_id])
+        else:
+            units.append((original_chat_id, [message_id]))
+    
+    batches = []
+    for original_chat_id, message_ids in units:
+        if (batches and batches[-1][0] == original_chat_id
+                and len(batches[-1][1]) + len(message_ids) <= FORWARD_BATCH_SIZE):
+            batches[-1][1].extend(message_ids)
+        else:
+            batches.append((original_chat_id, list(message_ids)))
+    
+    return batches
+
+async def deliver_to_channel(client: Client, channel_id: int, batches: list, post_id: str = None,
+                             completed=frozenset(), run_id: str = None):
+    """Forward a post's batches to one channel, skipping batches already in the ledger"""
+    try:
+        for batch_index, (original_chat_id, message_ids) in enumerate(batches):
+            if (channel_id, batch_index) in completed:
+                continue
             try:
-                # Group messages by message group ID to handle media groups
-                message_groups = {}
-                single_messages = []
-                
-                for msg_data in messages:
-                    group_id = msg_data.get('media_group_id')
-                    if group_id:
-                        if group_id not in message_groups:
-                            message_groups[group_id] = []
-                        message_groups[group_id].append(msg_data)
-                    else:
-                        single_messages.append(msg_data)
-                
-                # Send media groups first
-                for group_id, group_messages in message_groups.items():
-                    try:
-                        # Get all message IDs in the group
-                        message_ids = [msg['message_id'] for msg in group_messages if msg.get('message_id')]
-                        original_chat_id = group_messages[0].get('original_chat_id')
-                        
-                        if message_ids and original_chat_id:
-                            await client.forward_messages(
-                                chat_id=channel_id,
-                                from_chat_id=original_chat_id,
-                                message_ids=message_ids
-                            )
-                    except Exception as e:
-                        print(f"❌ Error forwarding media group: {e}")
-                
-                # Send single messages
-                for msg_data in single_messages:
-                    try:
-                        original_msg_id = msg_data.get('message_id')
-                        original_chat_id = msg_data.get('original_chat_id')
-                        
-                        if original_msg_id and original_chat_id:
-                            await client.forward_messages(
-                                chat_id=channel_id,
-                                from_chat_id=original_chat_id,
-                                message_ids=original_msg_id
-                            )
-                        
-                        # Small delay between messages
-                        await asyncio.sleep(0.5)
-                        
-                    except Exception as e:
-                        print(f"❌ Error forwarding single message: {e}")
-                
-                print(f"✅ Posts sent to channel: {channel_id}")
-                
+                delivered = await forward_with_retry(client, channel_id, original_chat_id, message_ids, post_id)
+                if run_id:
+                    await record_batch_delivery(
+                        run_id, channel_id, batch_index,
+                        'delivered' if delivered else 'dead_lettered'
+                    )
             except Exception as e:
-                print(f"❌ Error sending to channel {channel_id}: {e}")
-                continue
+                print(f"❌ Error forwarding batch of {len(message_ids)} messages: {e}")
         
+        print(f"✅ Posts sent to channel: {channel_id}")
+    
     except Exception as e:
-        print(f"❌ Error executing scheduled post: {e}")
+        print(f"❌ Error sending to channel {channel_id}: {e}")
 
 async def cancel_scheduled_post(post_id: str):
     """Cancel a scheduled post"""
     try:
-        # Cancel the task if running
-        if post_id in scheduler_tasks:
-            scheduler_tasks[post_id].cancel()
-            del scheduler_tasks[post_id]
+        # Drop it from the dispatcher queue
+        post_scheduler.cancel(post_id)
         
         # Remove from database
         await remove_scheduled_post(post_id)
@@ -371,7 +731,7 @@ async def list_channels_command(client: Client, message: Message):
         
         channels = await get_saved_channels()
         
-        if not channels or len(channels) <= 1:
+        if not channels:
             await message.reply_text("📭 No channels saved.")
             return
         
@@ -466,6 +826,56 @@ async def schedule_command(client: Client, message: Message):
     except Exception as e:
         print(f"❌ Error in schedule command: {e}")
 
+@Client.on_message(filters.command("recurring") & filters.private)
+async def recurring_command(client: Client, message: Message):
+    """Schedule forwarded messages on a repeating schedule - Admin only"""
+    try:
+        if not is_admin_user(message.from_user.id):
+            await message.reply_text("❌ You are not authorized to use this command.")
+            return
+        
+        spec = message.text.split(maxsplit=1)[1] if len(message.text.split()) > 1 else ''
+        
+        if not spec:
+            await message.reply_text(
+                "❌ Usage: <code>/recurring interval</code> or <code>/recurring cron</code>\n"
+                "Examples:\n"
+                "<code>/recurring 6h</code> - every 6 hours\n"
+                "<code>/recurring 0 9 * * *</code> - daily at 9:00 AM IST",
+                parse_mode=ParseMode.HTML
+            )
+            return
+        
+        try:
+            recurrence = parse_recurrence(spec)
+        except ValueError as e:
+            await message.reply_text(f"❌ Invalid schedule: {e}")
+            return
+        
+        # First run is the next occurrence from now
+        now = datetime.now(IST)
+        schedule_time = next_recurrence_time(recurrence, now, now)
+        
+        pending_forwards[message.from_user.id] = {
+            'schedule_time': schedule_time,
+            'recurrence': recurrence,
+            'messages': [],
+            'step': 'collecting_messages',
+            'media_groups': {}
+        }
+        
+        await message.reply_text(
+            f"✅ <b>Forward Collection Started!</b>\n\n"
+            f"<b>Repeats:</b> {describe_recurrence(recurrence)}\n"
+            f"<b>First Run:</b> {schedule_time.strftime('%Y-%m-%d %H:%M:%S IST')}\n\n"
+            f"📤 Now forward me the messages you want to schedule.\n"
+            f"Send <code>/done</code> when finished.",
+            parse_mode=ParseMode.HTML
+        )
+    
+    except Exception as e:
+        print(f"❌ Error in recurring command: {e}")
+
 # ==================== TIME PICKER CALLBACKS ====================
 
 @Client.on_callback_query(filters.regex(r"^date_"))
@@ -581,6 +991,145 @@ async def back_to_date_callback(client: Client, callback_query):
     except Exception as e:
         print(f"❌ Error going back to date picker: {e}")
 
+# ==================== DEAD LETTER COMMANDS ====================
+# Registered before the catch-all text handler below, which would otherwise swallow them
+
+@Client.on_message(filters.command("dead_letters") & filters.private)
+async def dead_letters_command(client: Client, message: Message):
+    """List failed deliveries - Admin only"""
+    try:
+        if not is_admin_user(message.from_user.id):
+            await message.reply_text("❌ You are not authorized to use this command.")
+            return
+        
+        total = await count_dead_letters()
+        
+        if not total:
+            await message.reply_text("📭 No failed deliveries.")
+            return
+        
+        entries = await get_dead_letters(limit=10)
+        text = f"<b>☠️ FAILED DELIVERIES ({total})</b>\n\n"
+        
+        for entry in entries:
+            failed_at = entry.get('failed_at')
+            time_str = failed_at.strftime('%Y-%m-%d %H:%M') if failed_at else 'Unknown'
+            text += (
+                f"<b>ID:</b> <code>{entry['_id']}</code>\n"
+                f"<b>Post:</b> <code>{entry.get('post_id')}</code> → <code>{entry.get('chat_id')}</code>\n"
+                f"<b>Error:</b> {entry.get('error', 'Unknown')[:100]}\n"
+                f"<b>Failed:</b> {time_str}\n\n"
+            )
+        
+        if total > 10:
+            text += f"<i>... and {total - 10} more</i>\n\n"
+        
+        text += "Use <code>/replay_dead id</code> or <code>/replay_dead all</code> to retry."
+        
+        await message.reply_text(text, parse_mode=ParseMode.HTML)
+    
+    except Exception as e:
+        print(f"❌ Error in dead_letters command: {e}")
+
+@Client.on_message(filters.command("replay_dead") & filters.private)
+async def replay_dead_command(client: Client, message: Message):
+    """Replay failed deliveries - Admin only"""
+    try:
+        if not is_admin_user(message.from_user.id):
+            await message.reply_text("❌ You are not authorized to use this command.")
+            return
+        
+        args = message.text.split()[1:] if len(message.text.split()) > 1 else []
+        
+        if not args:
+            await message.reply_text("❌ Usage: <code>/replay_dead id</code> or <code>/replay_dead all</code>", parse_mode=ParseMode.HTML)
+            return
+        
+        entries = await get_dead_letters()
+        if args[0] != 'all':
+            entries = [entry for entry in entries if str(entry['_id']) == args[0]]
+        
+        if not entries:
+            await message.reply_text("❌ No matching failed deliveries.")
+            return
+        
+        status = await message.reply_text(f"🔄 Replaying {len(entries)} failed deliveries...")
+        
+        async def replay(entry):
+            # Keep the entry until the forward has finished so a restart while
+            # waiting on the send buckets can't lose it; a failed replay has
+            # already been dead-lettered again with the fresh error by then
+            delivered = await forward_with_retry(
+                client,
+                entry['chat_id'],
+                entry['from_chat_id'],
+                entry['message_ids'],
+                entry.get('post_id')
+            )
+            await remove_dead_letter(entry['_id'])
+            return delivered
+        
+        results = await asyncio.gather(*(replay(entry) for entry in entries))
+        delivered = sum(1 for ok in results if ok)
+        
+        await safe_edit_message(
+            status,
+            f"✅ Replayed {delivered}/{len(entries)} failed deliveries."
+        )
+    
+    except Exception as e:
+        print(f"❌ Error in replay_dead command: {e}")
+
+# ==================== BULK IMPORT COMMAND ====================
+# Also ahead of the catch-all text handler; see import_schedule_file below
+
+@Client.on_message(filters.command("import_schedule") & filters.private)
+async def import_schedule_command(client: Client, message: Message):
+    """Bulk-schedule posts from a JSONL document - Admin only"""
+    try:
+        if not is_admin_user(message.from_user.id):
+            await message.reply_text("❌ You are not authorized to use this command.")
+            return
+        
+        document_message = message.reply_to_message if message.reply_to_message else message
+        if not document_message.document:
+            await message.reply_text(
+                "❌ Reply to a <code>.jsonl</code> file with <code>/import_schedule</code>\n\n"
+                "One JSON object per line:\n"
+                "<code>{\"source_chat\": -100123, \"message_ids\": [5, 6], "
+                "\"channels\": [-100456], \"fire_at\": \"2024-01-15 14:30\"}</code>\n"
+                "Optional: <code>recurrence</code> (e.g. <code>\"6h\"</code>), <code>post_id</code>",
+                parse_mode=ParseMode.HTML
+            )
+            return
+        
+        status = await message.reply_text("📥 Downloading import file...")
+        file_path = await client.download_media(
+            document_message,
+            file_name=os.path.join(Config.DOWNLOAD_DIR, f"import_{message.id}.jsonl")
+        )
+        
+        try:
+            await safe_edit_message(status, "🔄 Importing scheduled posts...")
+            stats = await import_schedule_file(file_path)
+        finally:
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+        
+        text = (
+            f"✅ <b>Import Finished</b>\n\n"
+            f"<b>Scheduled:</b> {stats['inserted']}\n"
+            f"<b>Invalid:</b> {stats['invalid']}\n"
+            f"<b>Duplicates:</b> {stats['duplicates']}"
+        )
+        if stats['errors']:
+            text += "\n\n<b>First errors:</b>\n" + "\n".join(stats['errors'])
+        
+        await safe_edit_message(status, text, parse_mode=ParseMode.HTML)
+    
+    except Exception as e:
+        print(f"❌ Error in import_schedule command: {e}")
+
 # ==================== CUSTOM INPUT HANDLERS ====================
 
 @Client.on_message(filters.text & filters.private)
@@ -728,10 +1277,50 @@ async def handle_forwarded_message(client: Client, message: Message):
             media_groups[message.media_group_id].append(msg_data)
         else:
             pending_forwards[user_id]['messages'].append(msg_data)
+        pending_forwards.save(user_id)
+        
+        # Acknowledge once the burst (e.g. all parts of an album) has arrived
+        previous = collection_ack_tasks.get(user_id)
+        if previous and not previous.done() and collection_ack_sending.get(user_id) is not previous:
+            # Still sleeping: nothing was sent yet, so it is safe to replace it
+            previous.cancel()
+        collection_ack_tasks[user_id] = asyncio.create_task(send_collection_ack(client, message))
+    
+    except Exception as e:
+        print(f"❌ Error handling forwarded message: {e}")
+
+async def send_collection_ack(client: Client, message: Message):
+    """Post or update the single collection status message for a user"""
+    user_id = message.from_user.id
+    try:
+        await asyncio.sleep(Config.COLLECT_ACK_DELAY)
+        
+        # From here on the task must not be cancelled: a reply that was sent but
+        # whose ID isn't saved yet would make the next ack post a second message
+        collection_ack_sending[user_id] = asyncio.current_task()
+        lock = collection_ack_locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            await update_collection_status(client, message)
+    
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        print(f"❌ Error sending collection acknowledgement: {e}")
+    finally:
+        if collection_ack_sending.get(user_id) is asyncio.current_task():
+            del collection_ack_sending[user_id]
+
+async def update_collection_status(client: Client, message: Message):
+    """Edit the user's status message, or post it (re-reading the session under the lock)"""
+    try:
+        user_id = message.from_user.id
+        session = pending_forwards.get(user_id)
+        if not session or session['step'] != 'collecting_messages':
+            return
         
         # Count total messages
-        single_count = len(pending_forwards[user_id]['messages'])
-        group_count = len(pending_forwards[user_id]['media_groups'])
+        single_count = len(session['messages'])
+        group_count = len(session['media_groups'])
         total_count = single_count + group_count
         
         # Create Done button
@@ -740,15 +1329,32 @@ async def handle_forwarded_message(client: Client, message: Message):
             [InlineKeyboardButton("❌ Cancel", callback_data="cancel_forward")]
         ])
         
-        await message.reply_text(
-            f"✅ <b>Message {total_count} collected!</b>\n\n"
-            f"📤 Forward more messages or click <b>Done</b> to proceed:",
-            reply_markup=keyboard,
-            parse_mode=ParseMode.HTML
+        text = (
+            f"✅ <b>{total_count} messages collected!</b>\n\n"
+            f"📤 Forward more messages or click <b>Done</b> to proceed:"
         )
         
+        status_id = session.get('status_message_id')
+        if status_id:
+            try:
+                await client.edit_message_text(
+                    chat_id=message.chat.id,
+                    message_id=status_id,
+                    text=text,
+                    reply_markup=keyboard,
+                    parse_mode=ParseMode.HTML
+                )
+                return
+            except Exception as e:
+                # Deleted or otherwise uneditable: fall back to a new reply
+                print(f"⚠️ Could not update collection status: {e}")
+        
+        status = await message.reply_text(text, reply_markup=keyboard, parse_mode=ParseMode.HTML)
+        session['status_message_id'] = status.id
+        pending_forwards.save(user_id)
+    
     except Exception as e:
-        print(f"❌ Error handling forwarded message: {e}")
+        print(f"❌ Error updating collection status: {e}")
 
 # Add this callback handler
 @Client.on_callback_query(filters.regex("^done_collecting$"))
@@ -769,8 +1375,8 @@ async def done_collecting_callback(client: Client, callback_query):
             await callback_query.answer("❌ Not in collection mode")
             return
         
-        # Combine messages
-        messages = pending_forwards[user_id]['messages']
+        # Combine messages (without mutating the session; scheduling combines again)
+        messages = list(pending_forwards[user_id]['messages'])
         media_groups = pending_forwards[user_id]['media_groups']
         
         for group_id, group_messages in media_groups.items():
@@ -783,7 +1389,7 @@ async def done_collecting_callback(client: Client, callback_query):
         # Get saved channels
         channels = await get_saved_channels()
         
-        if not channels or len(channels) <= 1:
+        if not channels:
             await callback_query.edit_message_text("❌ No channels saved. Use <code>/add_channel</code> first.", parse_mode=ParseMode.HTML)
             return
         
@@ -801,6 +1407,7 @@ async def done_collecting_callback(client: Client, callback_query):
         # Update step
         pending_forwards[user_id]['step'] = 'selecting_channels'
         pending_forwards[user_id]['selected_channels'] = []
+        pending_forwards.save(user_id)
         
         schedule_time = pending_forwards[user_id]['schedule_time']
         
@@ -841,6 +1448,7 @@ async def select_channel_callback(client: Client, callback_query):
         else:
             selected_channels.append(channel_id)
             await callback_query.answer("✅ Channel selected")
+        pending_forwards.save(user_id)
         
         # Update button text to show selection
         channels = await get_saved_channels()
@@ -902,9 +1510,10 @@ async def schedule_selected_callback(client: Client, callback_query):
             messages.extend(group_messages)
         
         schedule_time = pending_forwards[user_id]['schedule_time']
+        recurrence = pending_forwards[user_id].get('recurrence')
         
         # Schedule the post
-        post_id = await schedule_post(client, messages, selected_channels, schedule_time)
+        post_id = await schedule_post(client, messages, selected_channels, schedule_time, recurrence)
         
         if post_id:
             channels = await get_saved_channels()
@@ -914,6 +1523,7 @@ async def schedule_selected_callback(client: Client, callback_query):
                 f"✅ <b>Messages Scheduled Successfully!</b>\n\n"
                 f"<b>Post ID:</b> <code>{post_id}</code>\n"
                 f"<b>Schedule Time:</b> {schedule_time.strftime('%Y-%m-%d %H:%M:%S IST')}\n"
+                f"<b>Repeats:</b> {describe_recurrence(recurrence)}\n"
                 f"<b>Messages:</b> {len(messages)}\n"
                 f"<b>Channels:</b> {', '.join(channel_names)}",
                 parse_mode=ParseMode.HTML
@@ -951,15 +1561,16 @@ async def schedule_list_command(client: Client, message: Message):
             await message.reply_text("❌ You are not authorized to use this command.")
             return
         
-        posts = await get_scheduled_posts()
+        total = await count_scheduled_posts()
         
-        if not posts:
+        if not total:
             await message.reply_text("📭 No scheduled posts found.")
             return
         
+        posts = await get_scheduled_posts(limit=10)
         text = "<b>📅 SCHEDULED POSTS</b>\n\n"
         
-        for post in posts[:10]:
+        for post in posts:
             post_data = post.get('post_data', {})
             post_id = post_data.get('post_id', 'Unknown')
             schedule_time = post_data.get('schedule_time', '')
@@ -978,12 +1589,13 @@ async def schedule_list_command(client: Client, message: Message):
             text += (
                 f"<b>ID:</b> <code>{post_id}</code>\n"
                 f"<b>Time:</b> {time_str}\n"
+                f"<b>Repeats:</b> {describe_recurrence(post_data.get('recurrence'))}\n"
                 f"<b>Messages:</b> {len(messages)}\n"
                 f"<b>Channels:</b> {len(channels)}\n\n"
             )
         
-        if len(posts) > 10:
-            text += f"<i>... and {len(posts) - 10} more posts</i>"
+        if total > 10:
+            text += f"<i>... and {total - 10} more posts</i>"
         
         await message.reply_text(text, parse_mode=ParseMode.HTML)
         
@@ -1015,48 +1627,199 @@ async def schedule_cancel_command(client: Client, message: Message):
     except Exception as e:
         print(f"❌ Error in schedule_cancel command: {e}")
 
+# ==================== BULK IMPORT ====================
+
+# Records per insert_many call
+IMPORT_BATCH_SIZE = 1000
+
+def parse_import_record(line: str, now: datetime):
+    """
+    Validate one JSONL import record and turn it into a post document.
+    Expected fields: source_chat, message_ids, channels, fire_at, and
+    optionally recurrence (e.g. "6h" or a cron expression) and post_id.
+    """
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("record must be a JSON object")
+    
+    source_chat = record.get('source_chat')
+    if not isinstance(source_chat, int):
+        raise ValueError("source_chat must be an integer chat ID")
+    
+    message_ids = record.get('message_ids')
+    if isinstance(message_ids, int):
+        message_ids = [message_ids]
+    if (not isinstance(message_ids, list) or not message_ids
+            or not all(isinstance(m, int) and m > 0 for m in message_ids)):
+        raise ValueError("message_ids must be a non-empty list of positive integers")
+    
+    channels = record.get('channels')
+    if isinstance(channels, int):
+        channels = [channels]
+    if not isinstance(channels, list) or not channels or not all(isinstance(c, int) for c in channels):
+        raise ValueError("channels must be a non-empty list of integer chat IDs")
+    
+    fire_at_raw = record.get('fire_at')
+    if not isinstance(fire_at_raw, str):
+        raise ValueError("fire_at must be a date string")
+    try:
+        fire_at = datetime.fromisoformat(fire_at_raw.strip())
+    except ValueError:
+        raise ValueError(f"invalid fire_at: {fire_at_raw}")
+    fire_at = IST.localize(fire_at) if fire_at.tzinfo is None else fire_at.astimezone(IST)
+    if fire_at <= now:
+        raise ValueError(f"fire_at is in the past: {fire_at_raw}")
+    
+    post_id = str(record.get('post_id') or f"import_{uuid.uuid4().hex[:16]}")
+    post_data = {
+        'post_id': post_id,
+        'channels': channels,
+        'schedule_time': fire_at.isoformat(),
+        'messages': [
+            {'message_id': message_id, 'original_chat_id': source_chat, 'type': 'imported'}
+            for message_id in message_ids
+        ],
+        'created_at': now.isoformat()
+    }
+    if record.get('recurrence'):
+        post_data['recurrence'] = parse_recurrence(str(record['recurrence']))
+    
+    document = build_post_document(post_id, post_data)
+    document['_id'] = post_id
+    return document
+
+async def import_schedule_file(path: str, batch_size: int = IMPORT_BATCH_SIZE):
+    """
+    Stream a JSONL file into scheduled_posts, one insert_many per batch.
+    The file is read line by line, so memory use is bounded by the batch size.
+    """
+    stats = {'inserted': 0, 'invalid': 0, 'duplicates': 0, 'errors': []}
+    now = datetime.now(IST)
+    batch = []
+    
+    async def flush():
+        try:
+            result = await scheduled_posts.insert_many(batch, ordered=False)
+            stats['inserted'] += len(result.inserted_ids)
+        except BulkWriteError as e:
+            # Unordered: everything except the failed documents was inserted
+            details = e.details
+            stats['inserted'] += details.get('nInserted', 0)
+            for error in details.get('writeErrors', []):
+                if error.get('code') == 11000:
+                    stats['duplicates'] += 1
+                else:
+                    stats['invalid'] += 1
+        batch.clear()
+    
+    with open(path, 'r', encoding='utf-8') as source:
+        for line_no, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                batch.append(parse_import_record(line, now))
+            except (ValueError, TypeError) as e:
+                stats['invalid'] += 1
+                if len(stats['errors']) < 10:
+                    stats['errors'].append(f"line {line_no}: {e}")
+                continue
+            
+            if len(batch) >= batch_size:
+                await flush()
+    
+    if batch:
+        await flush()
+    
+    if stats['inserted']:
+        post_scheduler.reload()
+    
+    print(f"✅ Schedule import: {stats['inserted']} inserted, {stats['invalid']} invalid, "
+          f"{stats['duplicates']} duplicates")
+    return stats
+
+# ==================== PEER WARM-UP ====================
+
+# Outcome of the last warm-up, kept for the startup report
+peer_warmup_stats = {'resolved': 0, 'failed': {}, 'duration': 0.0}
+
+async def warm_up_peer(client: Client, chat_id: int, semaphore: asyncio.Semaphore):
+    """Fetch one chat so its peer (and access hash) lands in the session storage"""
+    async with semaphore:
+        while True:
+            try:
+                await client.get_chat(chat_id)
+                return None
+            except FloodWait as e:
+                # Startup waits for the warm-up, so long waits are left to the first send
+                if e.value > Config.PEER_WARMUP_MAX_WAIT:
+                    return f"FloodWait {e.value}s (skipped)"
+                print(f"⏳ FloodWait {e.value}s while warming up chat {chat_id}")
+                await asyncio.sleep(e.value)
+            except Exception as e:
+                return f"{type(e).__name__}: {e}"
+
+async def warm_up_peers(client: Client):
+    """
+    Resolve every saved channel and dump chat before the first delivery,
+    so no scheduled forward pays for peer resolution or hits PEER_ID_INVALID.
+    """
+    try:
+        started = time.monotonic()
+        if not channel_cache.loaded:
+            await channel_cache.load()
+        
+        chat_ids = []
+        for chat_id in [int(ch_id) for ch_id in channel_cache.get()] + list(Config.DUMP_CHAT_IDS):
+            if chat_id not in chat_ids:
+                chat_ids.append(chat_id)
+        
+        semaphore = asyncio.Semaphore(Config.PEER_WARMUP_CONCURRENCY)
+        tasks = {chat_id: asyncio.ensure_future(warm_up_peer(client, chat_id, semaphore)) for chat_id in chat_ids}
+        
+        # Bounded so a slow or throttled warm-up can't hold back scheduler startup
+        failed = {}
+        if tasks:
+            await asyncio.wait(tasks.values(), timeout=Config.PEER_WARMUP_TIMEOUT)
+        for chat_id, task in tasks.items():
+            if not task.done():
+                task.cancel()
+                failed[chat_id] = f"not resolved within {Config.PEER_WARMUP_TIMEOUT}s"
+            elif task.result():
+                failed[chat_id] = task.result()
+        peer_warmup_stats['resolved'] = len(chat_ids) - len(failed)
+        peer_warmup_stats['failed'] = failed
+        peer_warmup_stats['duration'] = time.monotonic() - started
+        
+        print(f"✅ Warmed up {peer_warmup_stats['resolved']}/{len(chat_ids)} peers "
+              f"in {peer_warmup_stats['duration']:.2f}s")
+        for chat_id, error in failed.items():
+            print(f"⚠️ Could not resolve chat {chat_id}: {error}")
+        return peer_warmup_stats
+    
+    except Exception as e:
+        print(f"❌ Error warming up peers: {e}")
+        return peer_warmup_stats
+
 # ==================== STARTUP FUNCTION ====================
 
 async def load_scheduled_posts_on_startup(client: Client):
-    """Load and reschedule posts on bot startup"""
+    """Start the dispatcher and drain overdue posts in the background"""
     try:
-        posts = await get_scheduled_posts()
-        now = datetime.now(IST)
+        await migrate_scheduled_posts()
+        await requeue_expired_posts()
         
-        for post in posts:
-            try:
-                post_data = post.get('post_data', {})
-                post_id = post_data.get('post_id')
-                schedule_time_str = post_data.get('schedule_time')
-                
-                if not post_id or not schedule_time_str:
-                    continue
-                
-                # Parse schedule time
-                schedule_time = datetime.fromisoformat(schedule_time_str)
-                if schedule_time.tzinfo is None:
-                    schedule_time = IST.localize(schedule_time)
-                else:
-                    schedule_time = schedule_time.astimezone(IST)
-                
-                # Check if post should be sent
-                if schedule_time <= now:
-                    # Send immediately if time has passed
-                    await execute_scheduled_post(client, post_data)
-                    await remove_scheduled_post(post_id)
-                    print(f"✅ Sent overdue post: {post_id}")
-                else:
-                    # Reschedule for future
-                    delay = (schedule_time - now).total_seconds()
-                    task = asyncio.create_task(send_scheduled_post(client, post_id, post_data, delay))
-                    scheduler_tasks[post_id] = task
-                    print(f"✅ Rescheduled post: {post_id} for {schedule_time.strftime('%Y-%m-%d %H:%M:%S IST')}")
-                    
-            except Exception as e:
-                print(f"❌ Error loading scheduled post: {e}")
-                continue
+        # Oldest first, so the most overdue posts go out first
+        overdue = await get_due_posts(time.time())
+        
+        # Future posts are loaded window by window by the dispatcher
+        post_scheduler.start(client)
+        
+        if overdue:
+            print(f"📬 {len(overdue)} overdue posts found, sending in the background "
+                  f"({Config.SCHEDULER_CATCHUP_CONCURRENCY} at a time)")
+            post_scheduler.catch_up(overdue, Config.SCHEDULER_CATCHUP_CONCURRENCY)
         
-        print(f"✅ Loaded {len(scheduler_tasks)} scheduled posts")
+        print(f"✅ Loaded {await count_scheduled_posts()} scheduled posts")
         
     except Exception as e:
         print(f"❌ Error loading scheduled posts on startup: {e}")
@@ -1067,6 +1830,17 @@ async def init_scheduler(client: Client):
     """Initialize scheduler on bot startup"""
     try:
         print("🔄 Initializing post scheduler...")
+        await ensure_indexes()
+        
+        restored = await pending_forwards.load()
+        if restored:
+            print(f"✅ Restored {restored} conversation sessions")
+        
+        if not channel_cache.loaded:
+            await channel_cache.load()
+        channel_cache.start()
+        print(f"✅ Cached {len(channel_cache.get())} saved channels")
+        
         await load_scheduled_posts_on_startup(client)
         print("✅ Post scheduler initialized successfully")
     except Exception as e:
@@ -1092,11 +1866,16 @@ async def schedule_help_command(client: Client, message: Message):
             
             "<b>📤 SCHEDULING COMMANDS:</b>\n"
             "• <code>/schedule</code> - Schedule forwarded messages\n"
-            "• <code>/schedule YYYY-MM-DD HH:MM</code> - Manual time input\n\n"
+            "• <code>/schedule YYYY-MM-DD HH:MM</code> - Manual time input\n"
+            "• <code>/recurring 6h</code> - Repeat every 30m / 6h / 1d\n"
+            "• <code>/recurring 0 9 * * *</code> - Repeat on a cron schedule\n\n"
             
             "<b>📋 MANAGEMENT COMMANDS:</b>\n"
             "• <code>/schedule_list</code> - View scheduled posts\n"
             "• <code>/schedule_cancel post_id</code> - Cancel scheduled post\n"
+            "• <code>/import_schedule</code> - Bulk import posts from a JSONL file\n"
+            "• <code>/dead_letters</code> - View failed deliveries\n"
+            "• <code>/replay_dead id|all</code> - Retry failed deliveries\n"
             "• <code>/cancel</code> - Cancel current operation\n\n"
             
             "<b>🔄 WORKFLOW:</b>\n"
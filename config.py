@@ -1,4 +1,5 @@
 import os
+import socket
 from typing import List, Optional
 
 class Config:
@@ -51,8 +52,18 @@ class Config:
     
     DOWNLOAD_DIR: str = "./downloads/"
     MAX_FILE_SIZE: int = 2 * 1024 * 1024 * 1024  # 2GB in bytes
+    SPLIT_SIZE_MARGIN: float = 0.01  # headroom kept below the part size limit when planning cuts
+    PIPELINE_BUFFER_PARTS: int = 16  # 512 KiB parts buffered between download and upload
+    PIPELINE_UPLOAD_WORKERS: int = 4  # parts uploaded in parallel while downloading
+    PIPELINE_READ_TIMEOUT: int = 60  # seconds without data before a streamed download is dropped
     PROGRESS_UPDATE_INTERVAL: int = 3  # seconds
     SESSION_TIMEOUT: int = 300  # 5 minutes
+    SESSION_MAX_ENTRIES: int = 1000  # least recently used sessions are evicted beyond this
+    SESSION_BACKEND: str = os.environ.get("SESSION_BACKEND", "mongo")  # mongo, redis or memory
+    REDIS_URL: str = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+    COLLECT_ACK_DELAY: float = 1.0  # seconds to wait for the rest of an album before acknowledging
+    MEDIA_CACHE_TTL: int = 30 * 24 * 3600  # seconds a URL -> file_id mapping is reused
+    MEDIA_CACHE_MAX_ENTRIES: int = 2000  # in-process LRU in front of the Mongo cache
     
     # ═══════════════════════════════════════════════════════════════
     #                    YT-DLP CONFIGURATION
@@ -60,12 +71,47 @@ class Config:
     
     YT_DLP_QUALITY: str = "best"
     AUDIO_QUALITY: str = "192"  # kbps for MP3
+    METADATA_WORKERS: int = 4  # threads running blocking yt-dlp extractions
+    METADATA_PER_DOMAIN: int = 2  # parallel extractions against one site
+    METADATA_CACHE_TTL: int = 600  # seconds extracted metadata is reused
+    METADATA_CACHE_SIZE: int = 512  # URLs kept in the metadata cache
     
     # ═══════════════════════════════════════════════════════════════
     #                    DUMP CHANNELS
     # ═══════════════════════════════════════════════════════════════
     
     DUMP_CHAT_IDS: List[int] = [-1002544745474, -1002818664382, -1002720183106, -1002460893841, -1002664225966, -1002770588536, -1002663153052, -1002857709387, -1002877451208, -1002774996981, -1002677745677, -1002765057759, -1002642208423]
+    DUMP_BALANCE_STRATEGY: str = os.environ.get("DUMP_BALANCE_STRATEGY", "round_robin")  # or least_throttled
+    MIRROR_CONCURRENCY: int = 6  # chats a finished upload is copied to in parallel
+    
+    # ═══════════════════════════════════════════════════════════════
+    #                    SCHEDULER CONFIGURATION
+    # ═══════════════════════════════════════════════════════════════
+    
+    # Telegram bot limits: ~30 messages/second overall, 20 messages/minute per channel
+    GLOBAL_SEND_RATE: float = 30.0  # messages per second across all chats
+    GLOBAL_SEND_BURST: int = 30
+    CHAT_SEND_RATE: float = 20 / 60  # messages per second per chat
+    CHAT_SEND_BURST: int = 20
+    
+    # Retries for transient send errors (FloodWait waits don't count as attempts)
+    SEND_MAX_RETRIES: int = 5
+    SEND_RETRY_BASE_DELAY: float = 1.0  # seconds, doubled per attempt
+    SEND_RETRY_MAX_DELAY: float = 60.0
+    
+    # Dispatcher only keeps posts due within this window in memory
+    SCHEDULER_WINDOW: int = 3600  # seconds
+    SCHEDULER_WINDOW_LIMIT: int = 10000  # max posts loaded per window query
+    SCHEDULER_CATCHUP_CONCURRENCY: int = 4  # overdue posts sent in parallel after downtime
+    
+    # Several bot processes may share one database; each claims posts under a lease
+    REPLICA_ID: str = os.environ.get("REPLICA_ID", f"{socket.gethostname()}:{os.getpid()}")
+    SCHEDULER_LEASE_SECONDS: int = 20  # a dead replica's posts are taken over after this
+    SCHEDULER_POLL_INTERVAL: int = 5  # seconds between checks for posts added by other replicas
+    CHANNEL_CACHE_CHECK_INTERVAL: int = 30  # seconds between saved-channels version checks
+    PEER_WARMUP_CONCURRENCY: int = 5  # chats resolved in parallel at startup
+    PEER_WARMUP_MAX_WAIT: int = 5  # longer FloodWaits mark the chat failed instead of stalling startup
+    PEER_WARMUP_TIMEOUT: int = 20  # seconds before startup stops waiting for the warm-up
     
     # ═══════════════════════════════════════════════════════════════
     #                    AUTHORIZATION
@@ -1,5 +1,6 @@
 import motor.motor_asyncio
 import os
+import re
 from datetime import datetime, timedelta
 import logging
 from config import Config
@@ -24,6 +25,12 @@ try:
     bot_settings = database['bot_settings']
     file_settings = database['file_settings']
     admin_states = database['admin_states']
+    dead_letters = database['dead_letters']
+    delivery_ledger = database['delivery_ledger']
+    scheduled_posts = database['scheduled_posts']
+    conversation_sessions = database['conversation_sessions']
+    media_cache = database['media_cache']
+    content_index = database['content_index']
     
     logging.info("✅ Database connection initialized")
     
@@ -500,6 +507,173 @@ async def has_pending_request(user_id: int, channel_id: int) -> bool:
         print(f"❌ Error checking pending request in DB: {e}")
         return False
     
+# ==================== DEAD LETTER FUNCTIONS ====================
+
+async def add_dead_letter(entry: dict):
+    """Store a delivery that failed permanently so admins can replay it"""
+    try:
+        entry = dict(entry)
+        entry.setdefault('failed_at', datetime.now())
+        result = await dead_letters.insert_one(entry)
+        print(f"☠️ Dead-lettered delivery to {entry.get('chat_id')}: {entry.get('error')}")
+        return result.inserted_id
+    except Exception as e:
+        print(f"❌ Error storing dead letter: {e}")
+        return None
+
+async def get_dead_letters(limit: int = 0):
+    """Get dead-lettered deliveries, oldest first"""
+    try:
+        entries = []
+        async for entry in dead_letters.find({}).sort('failed_at', 1).limit(limit):
+            entries.append(entry)
+        return entries
+    except Exception as e:
+        print(f"❌ Error getting dead letters: {e}")
+        return []
+
+async def count_dead_letters():
+    try:
+        return await dead_letters.count_documents({})
+    except Exception as e:
+        print(f"❌ Error counting dead letters: {e}")
+        return 0
+
+async def remove_dead_letter(entry_id):
+    """Remove a dead letter after a successful replay"""
+    try:
+        await dead_letters.delete_one({'_id': entry_id})
+        return True
+    except Exception as e:
+        print(f"❌ Error removing dead letter: {e}")
+        return False
+
+# ==================== DELIVERY LEDGER FUNCTIONS ====================
+
+async def ensure_indexes():
+    """Create the indexes the scheduler relies on (idempotent)"""
+    try:
+        await delivery_ledger.create_index('post_id')
+        await scheduled_posts.create_index([('status', 1), ('fire_at', 1)])
+        await conversation_sessions.create_index('expires_at', expireAfterSeconds=0)
+        await media_cache.create_index('expires_at', expireAfterSeconds=0)
+        await content_index.create_index('quick_key')
+        return True
+    except Exception as e:
+        print(f"❌ Error creating indexes: {e}")
+        return False
+
+async def record_batch_delivery(post_id: str, chat_id: int, batch_index: int, status: str = 'delivered'):
+    """Record the outcome of one (post, channel, batch) delivery"""
+    try:
+        # Deterministic _id makes the write a single atomic, idempotent upsert
+        await delivery_ledger.update_one(
+            {'_id': f'{post_id}:{chat_id}:{batch_index}'},
+            {'$set': {
+                'post_id': post_id,
+                'chat_id': chat_id,
+                'batch_index': batch_index,
+                'status': status,
+                'updated_at': datetime.now()
+            }},
+            upsert=True
+        )
+        return True
+    except Exception as e:
+        print(f"❌ Error recording delivery for {post_id}: {e}")
+        return False
+
+async def get_completed_batches(post_id: str):
+    """Get the set of (chat_id, batch_index) already handled for a post"""
+    try:
+        completed = set()
+        async for entry in delivery_ledger.find({'post_id': post_id}, {'chat_id': 1, 'batch_index': 1}):
+            completed.add((entry['chat_id'], entry['batch_index']))
+        return completed
+    except Exception as e:
+        print(f"❌ Error reading delivery ledger for {post_id}: {e}")
+        return set()
+
+async def clear_delivery_ledger(post_id: str, all_runs: bool = False):
+    """
+    Drop ledger entries once a post is fully handled.
+    all_runs also drops the per-run entries of a recurring post ("post_id@run").
+    """
+    try:
+        query = {'post_id': post_id}
+        if all_runs:
+            query = {'$or': [query, {'post_id': {'$regex': f'^{re.escape(post_id)}@'}}]}
+        await delivery_ledger.delete_many(query)
+        return True
+    except Exception as e:
+        print(f"❌ Error clearing delivery ledger for {post_id}: {e}")
+        return False
+
+# ==================== MEDIA CACHE FUNCTIONS ====================
+
+async def get_cached_media(key: str):
+    """Get an unexpired URL -> file_id cache entry"""
+    try:
+        return await media_cache.find_one({'_id': key, 'expires_at': {'$gt': datetime.utcnow()}})
+    except Exception as e:
+        print(f"❌ Error reading media cache: {e}")
+        return None
+
+async def store_cached_media(key: str, entry: dict, ttl: int):
+    """Store a URL -> file_id cache entry that expires after `ttl` seconds"""
+    try:
+        now = datetime.utcnow()
+        await media_cache.replace_one(
+            {'_id': key},
+            {**entry, '_id': key, 'created_at': now, 'expires_at': now + timedelta(seconds=ttl)},
+            upsert=True
+        )
+        return True
+    except Exception as e:
+        print(f"❌ Error writing media cache: {e}")
+        return False
+
+async def remove_cached_media(key: str):
+    """Drop a cache entry (e.g. when its file_id is no longer valid)"""
+    try:
+        await media_cache.delete_one({'_id': key})
+        return True
+    except Exception as e:
+        print(f"❌ Error removing media cache entry: {e}")
+        return False
+
+# ==================== CONTENT INDEX FUNCTIONS ====================
+
+async def find_content(sha256: str):
+    """Get an already uploaded file by its full content hash"""
+    try:
+        return await content_index.find_one({'_id': sha256})
+    except Exception as e:
+        print(f"❌ Error reading content index: {e}")
+        return None
+
+async def has_content_candidate(quick_key: str):
+    """Cheap pre-check: is any uploaded file the same size with the same first bytes?"""
+    try:
+        return await content_index.count_documents({'quick_key': quick_key}, limit=1) > 0
+    except Exception as e:
+        print(f"❌ Error reading content index: {e}")
+        return False
+
+async def store_content(fingerprint: dict, entry: dict):
+    """Index an uploaded file's file_ids under its content fingerprint"""
+    try:
+        await content_index.update_one(
+            {'_id': fingerprint['sha256']},
+            {'$set': {**entry, 'quick_key': fingerprint['quick_key'], 'size': fingerprint['size']},
+             '$setOnInsert': {'created_at': datetime.utcnow()}},
+            upsert=True
+        )
+        return True
+    except Exception as e:
+        print(f"❌ Error writing content index: {e}")
+        return False
+
 # ==================== UTILITY FUNCTIONS ====================
 
 def format_bytes(bytes_value):
@@ -2,13 +2,22 @@ import os
 import re
 import time
 import asyncio
+import heapq
 import subprocess
 import aiofiles
-from datetime import datetime
-from urllib.parse import urlparse
+import hashlib
+import json
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
 from config import Config
 import os
+import glob
+import io
 import math
+import shutil
 import subprocess
 from pathlib import Path
 
@@ -92,62 +101,209 @@ def extract_domain(url):
 
 # ==================== VIDEO UTILITIES ====================
 
-async def get_video_metadata(url):
-    """Get video metadata using yt-dlp"""
-    try:
-        import yt_dlp
+# yt-dlp extraction is blocking; it runs here instead of on the event loop
+metadata_executor = ThreadPoolExecutor(max_workers=Config.METADATA_WORKERS, thread_name_prefix="metadata")
+metadata_domain_limits = {}  # domain -> semaphore capping parallel extractions per site
+metadata_cache = OrderedDict()  # url -> (metadata, monotonic expiry), LRU order
+metadata_inflight = {}  # url -> future shared by concurrent lookups of the same URL
+
+def _extract_video_metadata(url):
+    """Blocking yt-dlp extraction (runs in metadata_executor)"""
+    import yt_dlp
+    
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': False,
+    }
+    
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
         
-        ydl_opts = {
-            'quiet': True,
-            'no_warnings': True,
-            'extract_flat': False,
+        return {
+            'title': info.get('title', 'Unknown'),
+            'duration': info.get('duration', 0),
+            'uploader': info.get('uploader', 'Unknown'),
+            'view_count': info.get('view_count', 0),
+            'upload_date': info.get('upload_date', ''),
+            'description': info.get('description', '')[:200] + '...' if info.get('description') else '',
+            'thumbnail': info.get('thumbnail', ''),
+            'filesize': info.get('filesize', 0) or info.get('filesize_approx', 0)
         }
-        
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            
-            metadata = {
-                'title': info.get('title', 'Unknown'),
-                'duration': info.get('duration', 0),
-                'uploader': info.get('uploader', 'Unknown'),
-                'view_count': info.get('view_count', 0),
-                'upload_date': info.get('upload_date', ''),
-                'description': info.get('description', '')[:200] + '...' if info.get('description') else '',
-                'thumbnail': info.get('thumbnail', ''),
-                'filesize': info.get('filesize', 0) or info.get('filesize_approx', 0)
-            }
-            
+
+def _cached_metadata(url):
+    cached = metadata_cache.get(url)
+    if cached is None:
+        return None
+    metadata, expires = cached
+    if expires <= time.monotonic():
+        del metadata_cache[url]
+        return None
+    metadata_cache.move_to_end(url)
+    return metadata
+
+async def _fetch_video_metadata(url):
+    domain = extract_domain(url)
+    semaphore = metadata_domain_limits.get(domain)
+    if semaphore is None:
+        semaphore = metadata_domain_limits[domain] = asyncio.Semaphore(Config.METADATA_PER_DOMAIN)
+    
+    async with semaphore:
+        loop = asyncio.get_running_loop()
+        metadata = await loop.run_in_executor(metadata_executor, _extract_video_metadata, url)
+    
+    metadata_cache[url] = (metadata, time.monotonic() + Config.METADATA_CACHE_TTL)
+    metadata_cache.move_to_end(url)
+    while len(metadata_cache) > Config.METADATA_CACHE_SIZE:
+        metadata_cache.popitem(last=False)
+    return metadata
+
+async def get_video_metadata(url):
+    """Get video metadata using yt-dlp (off the event loop, cached per URL)"""
+    try:
+        metadata = _cached_metadata(url)
+        if metadata is not None:
             return metadata
+        
+        # Concurrent lookups of one URL share a single extraction
+        future = metadata_inflight.get(url)
+        if future is None:
+            future = metadata_inflight[url] = asyncio.ensure_future(_fetch_video_metadata(url))
+            future.add_done_callback(lambda _: metadata_inflight.pop(url, None))
+        return await asyncio.shield(future)
             
     except Exception as e:
         print(f"❌ Error getting video metadata: {e}")
         return {}
 
-async def get_video_dimensions(file_path):
-    """Get video dimensions using ffprobe"""
+# ffprobe header results per file version: (path, inode, mtime, size) -> probe dict.
+# Packet indexes are never cached; they run to tens of MB for long videos.
+media_probe_cache = OrderedDict()
+MEDIA_PROBE_CACHE_SIZE = 256
+
+def _media_probe_key(path):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def _parse_probe_output(data):
+    """Turn ffprobe JSON into the probe dict returned by probe_media"""
+    streams = data.get('streams', [])
+    fmt = data.get('format', {})
+    video = next((st for st in streams if st.get('codec_type') == 'video'), {})
+    audio = next((st for st in streams if st.get('codec_type') == 'audio'), {})
+    
+    def number(value, cast=float):
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            return 0
+    
+    return {
+        'duration': number(fmt.get('duration')) or number(video.get('duration')),
+        'width': number(video.get('width'), int),
+        'height': number(video.get('height'), int),
+        'video_codec': video.get('codec_name'),
+        'audio_codec': audio.get('codec_name'),
+        'bit_rate': number(fmt.get('bit_rate'), int),
+        'size': number(fmt.get('size'), int),
+        'format': fmt.get('format_name'),
+        'has_video': bool(video),
+        'video_index': video.get('index')
+    }
+
+async def probe_media(path):
+    """
+    Probe a media file with a single ffprobe run: duration, dimensions,
+    codecs and bitrate. Results are memoized per (path, inode, mtime, size).
+    """
     try:
-        cmd = [
-            'ffprobe', '-v', 'quiet', '-print_format', 'json',
-            '-show_streams', file_path
-        ]
+        key = _media_probe_key(path)
+        cached = media_probe_cache.get(key)
+        if cached is not None:
+            media_probe_cache.move_to_end(key)
+            return cached
+        
+        entries = ('format=duration,bit_rate,size,format_name'
+                   ':stream=index,codec_type,codec_name,width,height,duration,bit_rate')
         
         process = await asyncio.create_subprocess_exec(
-            *cmd,
+            'ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_entries', entries, path,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE
         )
-        
         stdout, stderr = await process.communicate()
         
-        if process.returncode == 0:
-            import json
-            data = json.loads(stdout.decode())
-            
-            for stream in data.get('streams', []):
-                if stream.get('codec_type') == 'video':
-                    width = stream.get('width', 1280)
-                    height = stream.get('height', 720)
-                    return width, height
+        if process.returncode != 0:
+            print(f"❌ ffprobe failed for {path}: {stderr.decode(errors='ignore').strip()}")
+            return {}
+        
+        probe = _parse_probe_output(json.loads(stdout.decode()))
+        media_probe_cache[key] = probe
+        while len(media_probe_cache) > MEDIA_PROBE_CACHE_SIZE:
+            media_probe_cache.popitem(last=False)
+        return probe
+    
+    except Exception as e:
+        print(f"❌ Error probing media: {e}")
+        return {}
+
+async def read_packet_index(path, video_index):
+    """
+    Read the packet index of a media file (this reads the whole file).
+    ffprobe's CSV rows are parsed as they stream in and kept in flat arrays
+    (~17 bytes per packet) instead of one JSON document. Returns parallel
+    (pts_times, sizes, is_video_keyframe) arrays in file order, or None on failure.
+    """
+    process = None
+    try:
+        process = await asyncio.create_subprocess_exec(
+            'ffprobe', '-v', 'error', '-show_entries', 'packet=stream_index,pts_time,size,flags',
+            '-of', 'csv=p=0', path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stderr_task = asyncio.ensure_future(process.stderr.read())
+        
+        pts_times = array('d')
+        sizes = array('q')
+        keyframes = bytearray()
+        video = str(video_index)
+        
+        async for raw_line in process.stdout:
+            fields = raw_line.decode(errors='ignore').strip().split(',')
+            if len(fields) < 4 or fields[1] in ('', 'N/A'):
+                continue
+            try:
+                pts_times.append(float(fields[1]))
+                sizes.append(int(fields[2]))
+            except ValueError:
+                del pts_times[len(sizes):]
+                continue
+            keyframes.append(fields[0] == video and 'K' in fields[3])
+        
+        stderr = await stderr_task
+        await process.wait()
+        if process.returncode != 0:
+            print(f"❌ ffprobe packet read failed for {path}: {stderr.decode(errors='ignore').strip()}")
+            return None
+        
+        return pts_times, sizes, keyframes
+    
+    except Exception as e:
+        print(f"❌ Error reading packet index: {e}")
+        return None
+    
+    finally:
+        if process is not None and process.returncode is None:
+            process.kill()
+            await process.wait()
+
+async def get_video_dimensions(file_path):
+    """Get video dimensions using ffprobe"""
+    try:
+        probe = await probe_media(file_path)
+        if probe.get('width') and probe.get('height'):
+            return probe['width'], probe['height']
         
         return 1280, 720
         
@@ -189,18 +345,26 @@ async def get_video_duration_from_file(file_path):
             print(f"File does not exist: {file_path}")
             return 0
         
-        meta = await get_video_metadata(f"file:{file_path}")
-        duration = meta.get("duration", 0) if meta else 0
+        probe = await probe_media(file_path)
+        duration = probe.get("duration", 0) if probe else 0
         print(f"Video duration: {duration} seconds")
         return duration
     except Exception as e:
         print(f"Error getting video duration: {e}")
         return 0
 
-async def split_video(file_path, max_size=1.95 * 1024 * 1024 * 1024):
+# Container index bytes per packet (mp4 sample tables are ~12-16 bytes per sample)
+SPLIT_PACKET_OVERHEAD = 16
+
+# How many times an over-limit part may be split again
+SPLIT_MAX_DEPTH = 2
+
+async def split_video(file_path, max_size=1.95 * 1024 * 1024 * 1024, progress=None, _depth=0):
     """
-    Split video file into parts by duration if larger than max_size (default 1.95GB).
-    Uses get_video_metadata to get duration.
+    Split video file into parts if larger than max_size (default 1.95GB).
+    Cut points are planned on keyframes from the file's packet index so
+    every part fits max_size; all parts are written in one ffmpeg pass.
+    `progress(done_seconds, total_seconds)` is awaited as ffmpeg advances.
     """
     try:
         print(f"Starting video split for: {file_path}")
@@ -216,108 +380,47 @@ async def split_video(file_path, max_size=1.95 * 1024 * 1024 * 1024):
         if file_size <= max_size:
             print("File is under size limit, no splitting needed")
             return [file_path]
-
-        # Get video duration
-        duration = await get_video_duration_from_file(file_path)
-        if duration <= 0:
-            print("⚠️ Unable to get video duration or duration is zero.")
-            # Try alternative method to get duration
-            try:
-                import subprocess
-                cmd = [
-                    "ffprobe", "-v", "quiet", "-show_entries", "format=duration",
-                    "-of", "csv=p=0", str(file_path)
-                ]
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-                if result.returncode == 0 and result.stdout.strip():
-                    duration = float(result.stdout.strip())
-                    print(f"Got duration from ffprobe: {duration}")
-                else:
-                    print("Failed to get duration from ffprobe")
-                    return [file_path]
-            except Exception as probe_error:
-                print(f"ffprobe error: {probe_error}")
-                return [file_path]
-
+        
+        # Get duration and the packet index
+        probe = await probe_media(file_path)
+        duration = probe.get('duration', 0) if probe else 0
         if duration <= 0:
-            print("Still no valid duration, cannot split")
+            print("⚠️ Unable to get video duration or duration is zero, cannot split")
             return [file_path]
-
-        num_parts = math.ceil(file_size / max_size)
-        part_duration = duration / num_parts  # float division
         
-        print(f"Splitting into {num_parts} parts, each ~{part_duration:.2f} seconds")
-
-        chunks = []
-        chunk_num = 1
-
-        p = Path(file_path)
-        base_name = p.stem
-        extension = p.suffix
-        folder = p.parent
-
-        # Check if ffmpeg is available
-        try:
-            subprocess.run(["ffmpeg", "-version"], capture_output=True, check=True, timeout=10)
-        except (subprocess.CalledProcessError, FileNotFoundError, subprocess.TimeoutExpired) as e:
-            print(f"❌ ffmpeg not available: {e}")
-            return [file_path]
-
-        for i in range(num_parts):
-            start_time = part_duration * i
-            if i == num_parts - 1:
-                current_duration = duration - start_time
-                if current_duration <= 0:
-                    print(f"Skipping part {chunk_num} - invalid duration")
-                    break
-            else:
-                current_duration = part_duration
-
-            output_file = folder / f"{base_name}.part{chunk_num:03d}{extension}"
-            
-            print(f"Creating part {chunk_num}: {output_file}")
-            print(f"Start time: {start_time:.2f}s, Duration: {current_duration:.2f}s")
-
-            cmd = [
-                "ffmpeg", "-hide_banner", "-loglevel", "error",
-                "-ss", str(start_time),
-                "-i", str(file_path),
-                "-t", str(current_duration),
-                "-c", "copy",
-                "-avoid_negative_ts", "make_zero",
-                "-y", str(output_file)
-            ]
-
-            try:
-                print(f"Running command: {' '.join(cmd)}")
-                result = subprocess.run(
-                    cmd, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.PIPE,
-                    timeout=300  # 5 minute timeout per part
-                )
-
-                if result.returncode == 0 and output_file.exists():
-                    chunk_size = os.path.getsize(output_file)
-                    print(f"✅ Successfully created part {chunk_num}: {chunk_size} bytes")
-                    chunks.append(str(output_file))
-                    chunk_num += 1
+        cut_points = None
+        index = await read_packet_index(file_path, probe.get('video_index'))
+        if index and index[1]:
+            pts_times, sizes, keyframes = index
+            # Bytes the packet index doesn't see (attachments, container overhead)
+            reserve = max(0, file_size - sum(sizes))
+            cut_points = plan_split_points(zip(pts_times, sizes, keyframes), max_size, reserve=reserve)
+            del index, pts_times, sizes, keyframes  # not needed during the ffmpeg run
+        if not cut_points:
+            # No usable plan (an empty one can't be right for an oversize file):
+            # fall back to equal durations
+            num_parts = math.ceil(file_size / max_size)
+            cut_points = [duration / num_parts * i for i in range(1, num_parts)]
+        
+        print(f"Splitting into {len(cut_points) + 1} parts at {', '.join(f'{t:.2f}s' for t in cut_points)}")
+        
+        chunks = await run_segment_split(file_path, cut_points, duration, progress)
+        
+        # Planning leaves a margin, so this only triggers on pathological muxing overhead
+        checked = []
+        for chunk in chunks:
+            if os.path.getsize(chunk) > max_size and chunk != file_path:
+                if _depth >= SPLIT_MAX_DEPTH:
+                    print(f"❌ Part {chunk} is still over the limit after {_depth} re-splits")
                 else:
-                    error_msg = result.stderr.decode().strip() if result.stderr else "Unknown error"
-                    print(f"❌ Failed to split part {chunk_num}: {error_msg}")
-                    print(f"Return code: {result.returncode}")
-                    
-                    # If this is the first part and it fails, return original file
-                    if chunk_num == 1:
-                        print("First part failed, returning original file")
-                        return [file_path]
-                    
-            except subprocess.TimeoutExpired:
-                print(f"❌ Timeout while creating part {chunk_num}")
-                break
-            except Exception as cmd_error:
-                print(f"❌ Command execution error for part {chunk_num}: {cmd_error}")
-                break
+                    print(f"⚠️ Part {chunk} is over the limit, splitting it again")
+                    parts = await split_video(chunk, max_size, progress, _depth + 1)
+                    if parts != [chunk]:
+                        checked.extend(parts)
+                        os.remove(chunk)
+                        continue
+            checked.append(chunk)
+        chunks = checked
 
         if chunks:
             print(f"✅ Successfully split video into {len(chunks)} parts")
@@ -332,10 +435,193 @@ async def split_video(file_path, max_size=1.95 * 1024 * 1024 * 1024):
         traceback.print_exc()
         return [file_path]
 
+def plan_split_points(packets, max_size, margin=None, reserve=0):
+    """
+    Plan cut points (seconds) so every part stays under max_size.
+    Walks the packet index accumulating bytes and cuts at the last
+    video keyframe before the budget runs out; cutting as late as possible
+    also gives the fewest parts. `reserve` bytes are kept free in every
+    part for data outside the packet index. Returns None when a single
+    keyframe interval is larger than the budget (no keyframe-aligned plan exists).
+    """
+    margin = Config.SPLIT_SIZE_MARGIN if margin is None else margin
+    budget = max_size * (1 - margin) - reserve
+    if budget <= 0:
+        return None
+    
+    cut_points = []
+    part_bytes = 0  # payload plus estimated index overhead of the current part
+    last_key = None  # (pts, bytes in the part before that keyframe)
+    
+    for pts, size, is_key in packets:
+        if is_key and part_bytes > 0:
+            last_key = (pts, part_bytes)
+        
+        part_bytes += size + SPLIT_PACKET_OVERHEAD
+        if part_bytes <= budget:
+            continue
+        
+        if last_key is None:
+            return None
+        
+        cut_pts, bytes_before = last_key
+        cut_points.append(cut_pts)
+        part_bytes -= bytes_before
+        last_key = None
+    
+    # The segment muxer cuts at the first keyframe at or after each time
+    return [math.floor(pts * 1000) / 1000 for pts in cut_points]
+
+def segment_files(p):
+    """Part files run_segment_split writes for Path `p` (name.partNNN.ext)"""
+    pattern = glob.escape(str(p.parent / p.stem)) + ".part[0-9][0-9][0-9]" + glob.escape(p.suffix)
+    return sorted(glob.glob(pattern))
+
+async def run_segment_split(file_path, cut_points, duration, progress=None):
+    """
+    Cut a video at the given timestamps (seconds) with one async ffmpeg run.
+    Parts are named <name>.partNNN<ext>; returns their paths, or [] on failure.
+    """
+    if not shutil.which("ffmpeg"):
+        print("❌ ffmpeg not available")
+        return []
+    
+    p = Path(file_path)
+    list_file = p.parent / f"{p.stem}.parts.txt"
+    cmd = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats",
+        "-i", str(file_path),
+        "-c", "copy",
+        "-f", "segment",
+        "-segment_times", ",".join(f"{t:.3f}" for t in cut_points),
+        "-segment_start_number", "1",
+        "-segment_list", str(list_file),
+        "-segment_list_type", "flat",
+        "-reset_timestamps", "1",
+        "-avoid_negative_ts", "make_zero",
+        "-progress", "pipe:1",
+        "-y", str(p.parent / f"{p.stem}.part%03d{p.suffix}")
+    ]
+    print(f"Running command: {' '.join(cmd)}")
+    
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    
+    # Drain stderr concurrently so a chatty ffmpeg can't fill the pipe and stall
+    stderr_task = asyncio.ensure_future(process.stderr.read())
+    finished = False
+    try:
+        last_report = 0
+        
+        async for raw_line in process.stdout:
+            line = raw_line.decode(errors='ignore').strip()
+            if not line.startswith("out_time_us=") or progress is None:
+                continue
+            try:
+                done = int(line.split("=", 1)[1]) / 1_000_000
+            except ValueError:
+                continue
+            if time.monotonic() - last_report >= Config.PROGRESS_UPDATE_INTERVAL:
+                last_report = time.monotonic()
+                await progress(min(done, duration), duration)
+        
+        stderr = await stderr_task
+        await process.wait()
+        finished = True
+    
+    finally:
+        # Cancelled, or the progress callback raised: don't leave ffmpeg
+        # running unattended or half-written parts behind
+        if not finished:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+            stderr_task.cancel()
+            for leftover in segment_files(p) + [str(list_file)]:
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+    
+    parts = []
+    if list_file.exists():
+        with open(list_file) as listing:
+            parts = [str(p.parent / name.strip()) for name in listing if name.strip()]
+        os.remove(list_file)
+    
+    if process.returncode != 0:
+        print(f"❌ ffmpeg segment split failed: {stderr.decode(errors='ignore').strip()}")
+        # The list only names closed segments; the one being written is on disk too
+        for part in segment_files(p):
+            os.remove(part)
+        return []
+    
+    if progress is not None:
+        try:
+            await progress(duration, duration)
+        except Exception as e:
+            print(f"❌ Error reporting split progress: {e}")
+    
+    for part in parts:
+        print(f"✅ Created part: {part} ({os.path.getsize(part)} bytes)")
+    return parts
+
+# Bytes per copy syscall / fallback buffer when splitting generic files
+FILE_COPY_CHUNK = 64 * 1024 * 1024
+FILE_COPY_BUFFER = 8 * 1024 * 1024
+
+def copy_file_range_to(src_fd, dst_fd, offset, length):
+    """
+    Copy `length` bytes starting at `offset` of src_fd to the current
+    position of dst_fd using constant memory. Prefers kernel-side copies
+    (copy_file_range, then sendfile) and falls back to a bounded buffer;
+    a method that stops short hands the rest to the next one.
+    Returns the method that finished the copy; raises OSError on a short copy.
+    """
+    copied = 0
+    
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while copied < length:
+                sent = os.copy_file_range(src_fd, dst_fd, min(FILE_COPY_CHUNK, length - copied), offset + copied)
+                if sent == 0:
+                    break
+                copied += sent
+            if copied == length:
+                return 'copy_file_range'
+        except OSError:
+            # Cross-filesystem on old kernels, or unsupported by the filesystem
+            pass
+    
+    if hasattr(os, 'sendfile'):
+        try:
+            while copied < length:
+                sent = os.sendfile(dst_fd, src_fd, offset + copied, min(FILE_COPY_CHUNK, length - copied))
+                if sent == 0:
+                    break
+                copied += sent
+            if copied == length:
+                return 'sendfile'
+        except OSError:
+            pass
+    
+    while copied < length:
+        data = os.pread(src_fd, min(FILE_COPY_BUFFER, length - copied), offset + copied)
+        if not data:
+            break
+        view = memoryview(data)
+        while view:
+            view = view[os.write(dst_fd, view):]
+        copied += len(data)
+    if copied != length:
+        raise OSError(f"Short copy: {copied} of {length} bytes at offset {offset}")
+    return 'buffered'
+
 # Alternative splitting function for non-video files
 def split_file(file_path, max_size=1.95 * 1024 * 1024 * 1024):
     """
-    Split any file into parts by size
+    Split any file into parts by size, copying in the kernel with constant memory
     """
     try:
         print(f"Starting file split for: {file_path}")
@@ -358,21 +644,27 @@ def split_file(file_path, max_size=1.95 * 1024 * 1024 * 1024):
         base_name = p.stem
         extension = p.suffix
         folder = p.parent
+        part_size = int(max_size)
 
         with open(file_path, 'rb') as input_file:
-            while True:
-                chunk_data = input_file.read(int(max_size))
-                if not chunk_data:
-                    break
-                
+            src_fd = input_file.fileno()
+            for offset in range(0, file_size, part_size):
+                length = min(part_size, file_size - offset)
                 output_file = folder / f"{base_name}.part{chunk_num:03d}{extension}"
                 
-                with open(output_file, 'wb') as output_chunk:
-                    output_chunk.write(chunk_data)
+                try:
+                    with open(output_file, 'wb') as output_chunk:
+                        method = copy_file_range_to(src_fd, output_chunk.fileno(), offset, length)
+                except OSError:
+                    # Don't leave a truncated set of parts behind
+                    for chunk in chunks + [str(output_file)]:
+                        if os.path.exists(chunk):
+                            os.remove(chunk)
+                    raise
                 
                 if os.path.exists(output_file):
                     chunk_size = os.path.getsize(output_file)
-                    print(f"✅ Created chunk {chunk_num}: {chunk_size} bytes")
+                    print(f"✅ Created chunk {chunk_num}: {chunk_size} bytes ({method})")
                     chunks.append(str(output_file))
                     chunk_num += 1
                 else:
@@ -392,6 +684,90 @@ def split_file(file_path, max_size=1.95 * 1024 * 1024 * 1024):
         traceback.print_exc()
         return [file_path]
 
+class VirtualFilePart(io.RawIOBase):
+    """
+    Read-only, seekable view of bytes [offset, offset + length) of a file.
+    Handed to Pyrogram in place of a written part file: reads go straight
+    to the original with os.pread, so no part ever touches disk.
+    """
+    
+    def __init__(self, path, offset, length, name=None):
+        super().__init__()
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.name = name or os.path.basename(path)
+        self._fd = os.open(path, os.O_RDONLY)
+        self._pos = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def tell(self):
+        return self._pos
+    
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self.length
+        if pos < 0:
+            raise ValueError("negative seek position")
+        self._pos = pos
+        return self._pos
+    
+    def readinto(self, buffer):
+        size = min(len(buffer), self.length - self._pos)
+        if size <= 0:
+            return 0
+        data = os.pread(self._fd, size, self.offset + self._pos)
+        buffer[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+    
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length - self._pos
+        size = min(size, self.length - self._pos)
+        if size <= 0:
+            return b""
+        data = os.pread(self._fd, size, self.offset + self._pos)
+        self._pos += len(data)
+        return data
+    
+    def close(self):
+        if not self.closed:
+            os.close(self._fd)
+        super().close()
+
+def virtual_split_file(file_path, max_size=1.95 * 1024 * 1024 * 1024):
+    """
+    Like split_file, but returns VirtualFilePart views instead of writing
+    part files, halving peak disk usage. Parts carry the same
+    name.partNNN.ext names; close them after uploading.
+    """
+    try:
+        file_size = os.path.getsize(file_path)
+        if file_size <= max_size:
+            return [file_path]
+        
+        p = Path(file_path)
+        part_size = int(max_size)
+        parts = []
+        for chunk_num, offset in enumerate(range(0, file_size, part_size), 1):
+            name = f"{p.stem}.part{chunk_num:03d}{p.suffix}"
+            parts.append(VirtualFilePart(file_path, offset, min(part_size, file_size - offset), name))
+        
+        print(f"✅ Prepared {len(parts)} virtual parts for {file_path}")
+        return parts
+    
+    except Exception as e:
+        print(f"❌ Error preparing virtual parts: {e}")
+        return [file_path]
+
 # Helper function to check if a file is a video
 def is_video_file(file_path):
     """Check if file is a video based on extension and mime type"""
@@ -521,6 +897,708 @@ def get_system_info():
             'disk_total': 0
         }
 
+# ==================== RATE LIMITING ====================
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, holding at most `capacity`"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self, tokens=1):
+        """
+        Wait until `tokens` are available and take them. Requests above
+        capacity are charged in full, one capacity-sized chunk at a time.
+        """
+        remaining = float(tokens)
+        async with self._lock:
+            while remaining > 0:
+                self._refill()
+                chunk = min(remaining, self.capacity)
+                if self.tokens >= chunk:
+                    self.tokens -= chunk
+                    remaining -= chunk
+                    continue
+                await asyncio.sleep((chunk - self.tokens) / self.rate)
+
+# ==================== DUMP CHANNEL BALANCING ====================
+
+class DumpBalancer:
+    """
+    Spread uploads across Config.DUMP_CHAT_IDS.
+    Strategies: "round_robin" rotates through the channels, "least_throttled"
+    prefers the channel whose last FloodWait is oldest (then the least busy).
+    Channels in a FloodWait cooldown are skipped until it lifts.
+    """
+    
+    STRATEGIES = ('round_robin', 'least_throttled')
+    
+    def __init__(self, chat_ids, strategy='round_robin'):
+        self.chat_ids = list(chat_ids)
+        self.strategy = strategy if strategy in self.STRATEGIES else 'round_robin'
+        self.cooldown_until = {}  # chat_id -> monotonic time the FloodWait lifts
+        self.last_throttled = {}  # chat_id -> monotonic time of the last FloodWait
+        self.in_flight = {chat_id: 0 for chat_id in self.chat_ids}
+        self._next = 0
+    
+    def available(self):
+        """Channels not cooling down right now"""
+        now = time.monotonic()
+        return [c for c in self.chat_ids if self.cooldown_until.get(c, 0) <= now]
+    
+    def _choose(self, candidates):
+        if self.strategy == 'least_throttled':
+            return min(candidates, key=lambda c: (self.last_throttled.get(c, 0), self.in_flight[c]))
+        
+        for _ in range(len(self.chat_ids)):
+            chat_id = self.chat_ids[self._next % len(self.chat_ids)]
+            self._next += 1
+            if chat_id in candidates:
+                return chat_id
+        return candidates[0]
+    
+    async def acquire(self):
+        """Pick a dump channel, waiting out cooldowns if every channel is throttled"""
+        if not self.chat_ids:
+            raise ValueError("No dump channels configured")
+        
+        while True:
+            candidates = self.available()
+            if candidates:
+                chat_id = self._choose(candidates)
+                self.in_flight[chat_id] += 1
+                return chat_id
+            await asyncio.sleep(max(0.0, min(self.cooldown_until.values()) - time.monotonic()))
+    
+    def release(self, chat_id):
+        """Mark an upload to `chat_id` as finished"""
+        if self.in_flight.get(chat_id, 0) > 0:
+            self.in_flight[chat_id] -= 1
+    
+    def throttled(self, chat_id, seconds):
+        """Record a FloodWait so the channel is skipped for `seconds`"""
+        now = time.monotonic()
+        self.last_throttled[chat_id] = now
+        self.cooldown_until[chat_id] = max(self.cooldown_until.get(chat_id, 0), now + seconds)
+    
+    def stats(self):
+        """Per-channel cooldown and load snapshot"""
+        now = time.monotonic()
+        return {
+            chat_id: {
+                'cooldown': max(0.0, self.cooldown_until.get(chat_id, 0) - now),
+                'in_flight': self.in_flight[chat_id]
+            }
+            for chat_id in self.chat_ids
+        }
+
+dump_balancer = DumpBalancer(Config.DUMP_CHAT_IDS, Config.DUMP_BALANCE_STRATEGY)
+
+async def send_to_dump(send, balancer=None):
+    """
+    Run `await send(chat_id)` against a balanced dump channel.
+    On FloodWait the channel is put in cooldown and the upload moves to
+    another channel instead of sleeping on the throttled one.
+    Returns (chat_id, result).
+    """
+    from pyrogram.errors import FloodWait
+    
+    balancer = balancer or dump_balancer
+    while True:
+        chat_id = await balancer.acquire()
+        try:
+            return chat_id, await send(chat_id)
+        except FloodWait as e:
+            print(f"⏳ Dump channel {chat_id} throttled for {e.value}s, switching channel")
+            balancer.throttled(chat_id, e.value)
+        finally:
+            balancer.release(chat_id)
+
+# ==================== MEDIA MIRRORING ====================
+
+def get_media_file_id(message):
+    """Telegram file_id of the media in a sent message, or None"""
+    try:
+        media = getattr(message, 'media', None)
+        if not media:
+            return None
+        return getattr(getattr(message, media.value, None), 'file_id', None)
+    except Exception as e:
+        print(f"❌ Error reading file_id: {e}")
+        return None
+
+async def fan_out_media(client, targets, source_message=None, file_id=None, caption=None, concurrency=None):
+    """
+    Re-send already uploaded media to every target chat without uploading again.
+    Uses copy_message when the source message is known (keeps caption and
+    thumbnail), otherwise send_cached_media with the file_id.
+    Returns (delivered {chat_id: message_id}, failed {chat_id: error}).
+    """
+    from pyrogram.errors import FloodWait
+    
+    semaphore = asyncio.Semaphore(concurrency or Config.MIRROR_CONCURRENCY)
+    delivered, failed = {}, {}
+    
+    async def send_one(chat_id):
+        async with semaphore:
+            while True:
+                try:
+                    if source_message is not None:
+                        sent = await client.copy_message(chat_id, source_message.chat.id, source_message.id)
+                    else:
+                        sent = await client.send_cached_media(chat_id, file_id, caption=caption or "")
+                    delivered[chat_id] = sent.id
+                    return
+                except FloodWait as e:
+                    print(f"⏳ FloodWait {e.value}s mirroring to {chat_id}")
+                    await asyncio.sleep(e.value)
+                except Exception as e:
+                    failed[chat_id] = f"{type(e).__name__}: {e}"
+                    print(f"❌ Error mirroring to {chat_id}: {e}")
+                    return
+    
+    await asyncio.gather(*(send_one(chat_id) for chat_id in targets))
+    return delivered, failed
+
+async def mirror_upload(client, upload, targets=None):
+    """
+    Upload a file once and mirror it to many chats.
+    `upload(chat_id)` performs the real upload and returns the sent message;
+    it runs once, against a balanced dump channel. Every other target
+    (default: the remaining dump channels) then gets a cheap copy.
+    """
+    try:
+        first_chat, message = await send_to_dump(upload)
+        
+        if targets is None:
+            targets = Config.DUMP_CHAT_IDS
+        targets = [chat_id for chat_id in dict.fromkeys(targets) if chat_id != first_chat]
+        
+        file_id = get_media_file_id(message)
+        delivered, failed = await fan_out_media(client, targets, source_message=message, file_id=file_id)
+        delivered[first_chat] = message.id
+        
+        print(f"✅ Mirrored upload to {len(delivered)} chats ({len(failed)} failed)")
+        return {'message': message, 'file_id': file_id, 'delivered': delivered, 'failed': failed}
+    
+    except Exception as e:
+        print(f"❌ Error in mirror upload: {e}")
+        return None
+
+# ==================== RECURRENCE UTILITIES ====================
+
+CRON_FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+def parse_cron_field(field, low, high):
+    """Expand one cron field (*, */n, a-b, a-b/n, a,b) into a set of values"""
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/', 1)
+            step = int(step)
+            if step <= 0:
+                raise ValueError(f"Invalid step in cron field: {field}")
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = map(int, part.split('-', 1))
+        else:
+            start = end = int(part)
+            if step > 1:
+                end = high
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron field out of range: {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+def parse_cron(expression):
+    """Parse a 5-field cron expression (minute hour day month weekday)"""
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError("Cron expression needs 5 fields: minute hour day month weekday")
+    
+    parsed = [parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELD_RANGES)]
+    # Sunday may be written as 0 or 7
+    if 7 in parsed[4]:
+        parsed[4].discard(7)
+        parsed[4].add(0)
+    return parsed
+
+def next_cron_time(expression, after):
+    """First time strictly after `after` (naive local datetime) matching the cron expression"""
+    minutes, hours, days, months, weekdays = parse_cron(expression)
+    fields = expression.split()
+    day_restricted = fields[2] != '*'
+    weekday_restricted = fields[4] != '*'
+    
+    t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    limit = t + timedelta(days=366 * 5)
+    
+    while t < limit:
+        if t.month not in months:
+            t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            continue
+        
+        # Cron semantics: when both day fields are restricted either may match
+        day_ok = t.day in days
+        weekday_ok = (t.weekday() + 1) % 7 in weekdays
+        if day_restricted and weekday_restricted:
+            matches_day = day_ok or weekday_ok
+        else:
+            matches_day = day_ok and weekday_ok
+        if not matches_day:
+            t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            continue
+        
+        if t.hour not in hours:
+            t = t.replace(minute=0) + timedelta(hours=1)
+            continue
+        
+        if t.minute not in minutes:
+            t += timedelta(minutes=1)
+            continue
+        
+        return t
+    
+    raise ValueError(f"Cron expression never fires: {expression}")
+
+def parse_recurrence(text):
+    """
+    Parse a recurrence spec: an interval like 30m / 6h / 1d,
+    or a 5-field cron expression. Returns a dict stored with the post.
+    """
+    text = text.strip()
+    match = re.fullmatch(r'(\d+)\s*([mhd])', text.lower())
+    if match:
+        seconds = int(match.group(1)) * {'m': 60, 'h': 3600, 'd': 86400}[match.group(2)]
+        if seconds < 60:
+            raise ValueError("Interval must be at least 1 minute")
+        return {'type': 'interval', 'seconds': seconds, 'spec': text}
+    
+    # Also rejects valid-looking crons that never fire (e.g. 0 0 31 2 *)
+    next_cron_time(text, datetime.now())
+    return {'type': 'cron', 'expr': text, 'spec': text}
+
+def next_recurrence_time(recurrence, last_fire, now):
+    """
+    Next fire time after a run. Both datetimes are timezone-aware.
+    Intervals advance arithmetically (missed runs are skipped, not replayed).
+    """
+    if recurrence['type'] == 'interval':
+        step = recurrence['seconds']
+        missed = max(0, int((now - last_fire).total_seconds() // step))
+        return last_fire + timedelta(seconds=step * (missed + 1))
+    
+    tz = now.tzinfo
+    local_now = now.astimezone(tz).replace(tzinfo=None)
+    next_local = next_cron_time(recurrence['expr'], local_now)
+    return tz.localize(next_local) if hasattr(tz, 'localize') else next_local.replace(tzinfo=tz)
+
+def describe_recurrence(recurrence):
+    """Short label for a recurrence spec"""
+    if not recurrence:
+        return 'Once'
+    if recurrence['type'] == 'interval':
+        return f"Every {format_time(recurrence['seconds'])}"
+    return f"Cron <code>{recurrence['expr']}</code>"
+
+# ==================== SCHEDULER ENGINE ====================
+
+class PostScheduler:
+    """
+    Single dispatcher for every scheduled post.
+    Posts sit in a min-heap keyed by fire time; one coroutine sleeps until
+    the earliest entry is due instead of one sleeping task per post.
+    Only posts due within Config.SCHEDULER_WINDOW are held in memory; the
+    window is refilled from the scheduled_posts collection as time moves on.
+    Several replicas can run side by side: each post is claimed atomically
+    before sending, so exactly one replica delivers it.
+    The database side is injected: send_post(client, post_id) claims and
+    sends a post, get_due_posts(until, limit, exclude) lists pending posts,
+    renew_leases(post_ids) and requeue_expired() maintain the claims.
+    """
+    
+    def __init__(self, send_post, get_due_posts, renew_leases, requeue_expired):
+        self._send_post = send_post
+        self._get_due_posts = get_due_posts
+        self._renew_leases = renew_leases
+        self._requeue_expired = requeue_expired
+        self._heap = []        # [fire_at, seq, post_id] entries
+        self._entries = {}     # post_id -> heap entry
+        self._seq = 0
+        self._horizon = 0      # posts firing before this timestamp are loaded
+        self._refill_at = 0
+        self._poll_at = 0
+        self._sending = set()  # post IDs popped but not yet removed from the DB
+        self._wakeup = asyncio.Event()
+        self._inflight = set()
+        self._task = None
+        self._lease_task = None
+        self._client = None
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def __contains__(self, post_id):
+        return post_id in self._entries
+    
+    def start(self, client):
+        """Start the dispatcher coroutine (no-op if already running)"""
+        self._client = client
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        if self._lease_task is None or self._lease_task.done():
+            self._lease_task = asyncio.create_task(self._keep_leases())
+    
+    def add(self, post_id: str, fire_at: float):
+        """Queue a post to fire at the given UNIX timestamp - O(log n)"""
+        if post_id in self._entries:
+            self.cancel(post_id)
+        if fire_at > self._horizon:
+            # Outside the loaded window, the next refill will pick it up
+            return
+        self._seq += 1
+        entry = [fire_at, self._seq, post_id]
+        self._entries[post_id] = entry
+        heapq.heappush(self._heap, entry)
+        # Only wake the dispatcher when the earliest deadline changed
+        if self._heap[0] is entry:
+            self._wakeup.set()
+    
+    def cancel(self, post_id: str):
+        """Remove a queued post - O(1) tombstone, purged lazily"""
+        entry = self._entries.pop(post_id, None)
+        if entry is None:
+            return False
+        entry[2] = None
+        # Rebuild once tombstones dominate so memory stays proportional to live posts
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._entries):
+            self._heap = [e for e in self._heap if e[2] is not None]
+            heapq.heapify(self._heap)
+        return True
+    
+    def next_fire_at(self):
+        """Fire time of the earliest queued post, or None"""
+        self._drop_cancelled()
+        return self._heap[0][0] if self._heap else None
+    
+    def _drop_cancelled(self):
+        while self._heap and self._heap[0][2] is None:
+            heapq.heappop(self._heap)
+    
+    async def refill(self):
+        """Load every post due before the next window boundary"""
+        now = time.time()
+        horizon = now + Config.SCHEDULER_WINDOW
+        # Posts still being claimed by send tasks must not eat the query limit
+        posts = await self._get_due_posts(horizon, Config.SCHEDULER_WINDOW_LIMIT, exclude=self._sending)
+        full = len(posts) >= Config.SCHEDULER_WINDOW_LIMIT
+        if full:
+            # Window is full; stop at the last post we actually loaded
+            horizon = posts[-1]['fire_at']
+        
+        self._horizon = horizon
+        added = 0
+        for post in posts:
+            if post['_id'] not in self._entries:
+                self.add(post['_id'], post['fire_at'])
+                added += 1
+        
+        if not full:
+            # Refill once we're halfway through the loaded window
+            self._refill_at = now + Config.SCHEDULER_WINDOW / 2
+        elif added:
+            # Load the next slice as soon as this one has been dispatched
+            self._refill_at = horizon
+        else:
+            # Everything loaded is still being sent; back off briefly
+            self._refill_at = now + 1
+        return added
+    
+    async def poll(self):
+        """Pick up posts due soon that another replica may have added"""
+        now = time.time()
+        self._poll_at = now + Config.SCHEDULER_POLL_INTERVAL
+        posts = await self._get_due_posts(
+            now + 2 * Config.SCHEDULER_POLL_INTERVAL,
+            Config.SCHEDULER_WINDOW_LIMIT,
+            exclude=self._sending
+        )
+        for post in posts:
+            if post['_id'] not in self._entries:
+                self.add(post['_id'], post['fire_at'])
+    
+    async def _keep_leases(self):
+        """Renew our leases and take over posts from replicas that died"""
+        while True:
+            try:
+                await asyncio.sleep(Config.SCHEDULER_LEASE_SECONDS / 3)
+                if self._sending:
+                    await self._renew_leases(list(self._sending))
+                if await self._requeue_expired():
+                    # Requeued posts are already due; reload them right away
+                    self._poll_at = 0
+                    self._wakeup.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Error maintaining scheduler leases: {e}")
+    
+    def reload(self):
+        """Re-read the current window from the database (e.g. after a bulk import)"""
+        self._refill_at = 0
+        self._wakeup.set()
+    
+    def catch_up(self, posts: list, concurrency: int):
+        """
+        Drain overdue posts in the background with a bounded worker pool.
+        `posts` must be ordered by fire time so the latest-running go first.
+        """
+        # Reserve them so window refills don't dispatch them a second time
+        self._sending.update(post['_id'] for post in posts)
+        task = asyncio.create_task(self._drain(posts, concurrency))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+        return task
+    
+    async def _drain(self, posts: list, concurrency: int):
+        queue = asyncio.Queue()
+        for post in posts:
+            queue.put_nowait(post['_id'])
+        
+        total = len(posts)
+        done = 0
+        start_time = time.monotonic()
+        report_every = max(1, total // 10)
+        
+        async def worker():
+            nonlocal done
+            while True:
+                try:
+                    post_id = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    await self._send_post(self._client, post_id)
+                finally:
+                    self._sending.discard(post_id)
+                    done += 1
+                    if done % report_every == 0 or done == total:
+                        print(f"📬 Overdue catch-up: {done}/{total} posts sent")
+        
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+        print(f"✅ Overdue catch-up finished: {total} posts in {time.monotonic() - start_time:.1f}s")
+    
+    async def _run(self):
+        while True:
+            try:
+                self._wakeup.clear()
+                self._drop_cancelled()
+                now = time.time()
+                
+                if self._heap and self._heap[0][0] <= now:
+                    _, _, post_id = heapq.heappop(self._heap)
+                    del self._entries[post_id]
+                    
+                    self._sending.add(post_id)
+                    task = asyncio.create_task(self._send_post(self._client, post_id))
+                    self._inflight.add(task)
+                    task.add_done_callback(self._inflight.discard)
+                    task.add_done_callback(lambda _, post_id=post_id: self._sending.discard(post_id))
+                    continue
+                
+                if now >= self._refill_at:
+                    await self.refill()
+                    continue
+                
+                if now >= self._poll_at:
+                    await self.poll()
+                    continue
+                
+                delay = min(self._refill_at, self._poll_at) - now
+                if self._heap:
+                    delay = min(delay, self._heap[0][0] - now)
+                
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+            
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Error in scheduler dispatcher: {e}")
+                await asyncio.sleep(1)
+
+# ==================== SESSION STORE ====================
+
+class SessionStore:
+    """
+    Dict-like store for per-user conversation state.
+    Entries expire after `ttl` seconds without use, the oldest entries are
+    evicted beyond `max_entries`, and an optional backend (Mongo or Redis)
+    receives a write-through copy so sessions survive restarts.
+    Call save(key) after mutating a session in place.
+    """
+    
+    def __init__(self, ttl, max_entries, backend=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.backend = backend
+        self._data = OrderedDict()  # key -> (last_used, value), least recent first
+        self._dirty = set()
+        self._flush_task = None
+    
+    def _expired(self, last_used):
+        return time.monotonic() - last_used > self.ttl
+    
+    def _evict(self):
+        while self._data:
+            key, (last_used, _) = next(iter(self._data.items()))
+            if len(self._data) <= self.max_entries and not self._expired(last_used):
+                break
+            self._data.popitem(last=False)
+            # Evicted sessions are gone everywhere, not resurrected on restart
+            self.save(key)
+    
+    def __contains__(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return False
+        if self._expired(entry[0]):
+            del self._data[key]
+            return False
+        return True
+    
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        value = self._data[key][1]
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        return value
+    
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+    
+    def __setitem__(self, key, value):
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        self._evict()
+        self.save(key)
+    
+    def __delitem__(self, key):
+        self._data.pop(key, None)
+        self.save(key)
+    
+    def __len__(self):
+        self._evict()
+        return len(self._data)
+    
+    def save(self, key):
+        """Queue a write-through of the current state of `key`"""
+        if self.backend is None:
+            return
+        self._dirty.add(key)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+    
+    async def _flush(self):
+        # Always writes the latest state, so rapid updates can't land out of order
+        while self._dirty:
+            key = self._dirty.pop()
+            entry = self._data.get(key)
+            try:
+                if entry is None:
+                    await self.backend.delete(key)
+                else:
+                    await self.backend.save(key, entry[1], self.ttl)
+            except Exception as e:
+                print(f"❌ Error persisting session {key}: {e}")
+    
+    async def load(self):
+        """Restore unexpired sessions from the backend"""
+        if self.backend is None:
+            return 0
+        try:
+            restored = 0
+            for key, value in await self.backend.load_all():
+                self._data[key] = (time.monotonic(), value)
+                restored += 1
+            self._evict()
+            return restored
+        except Exception as e:
+            print(f"❌ Error restoring sessions: {e}")
+            return 0
+
+class MongoSessionBackend:
+    """Session persistence in a Mongo collection with a TTL index on expires_at"""
+    
+    def __init__(self, collection):
+        self.collection = collection
+    
+    async def save(self, key, value, ttl):
+        await self.collection.replace_one(
+            {'_id': key},
+            {'_id': key, 'value': value, 'expires_at': datetime.utcnow() + timedelta(seconds=ttl)},
+            upsert=True
+        )
+    
+    async def delete(self, key):
+        await self.collection.delete_one({'_id': key})
+    
+    async def load_all(self):
+        sessions = []
+        async for doc in self.collection.find({'expires_at': {'$gt': datetime.utcnow()}}):
+            sessions.append((doc['_id'], doc['value']))
+        return sessions
+
+def _session_json_default(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def _session_json_hook(value):
+    if set(value) == {'$dt'}:
+        return datetime.fromisoformat(value['$dt'])
+    return value
+
+class RedisSessionBackend:
+    """Session persistence in Redis (requires the optional `redis` package)"""
+    
+    def __init__(self, url, prefix='session:'):
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url)
+        self.prefix = prefix
+    
+    async def save(self, key, value, ttl):
+        payload = json.dumps(value, default=_session_json_default)
+        await self.redis.set(f"{self.prefix}{key}", payload, ex=int(ttl))
+    
+    async def delete(self, key):
+        await self.redis.delete(f"{self.prefix}{key}")
+    
+    async def load_all(self):
+        sessions = []
+        async for redis_key in self.redis.scan_iter(match=f"{self.prefix}*"):
+            payload = await self.redis.get(redis_key)
+            if payload is None:
+                continue
+            key = redis_key.decode()[len(self.prefix):]
+            sessions.append((int(key) if key.lstrip('-').isdigit() else key,
+                             json.loads(payload, object_hook=_session_json_hook)))
+        return sessions
+
 # ==================== AUTO DELETE UTILITY ====================
 
 async def auto_delete_message(client, chat_id, message_id, delay_seconds):
@@ -679,6 +1757,418 @@ def get_download_options(url):
         }
 
 
+# ==================== MEDIA CACHE ====================
+
+# Query parameters that never change which video a URL points to
+TRACKING_PARAMS = {'fbclid', 'gclid', 'igshid', 'igsh', 'si', 'feature', 'ref', 'ref_src', 's', 't'}
+
+def normalize_url(url):
+    """Canonical form of a URL for cache keys (host case, www., tracking params, fragment)"""
+    try:
+        parsed = urlparse(url.strip())
+        host = parsed.netloc.lower()
+        if host.startswith('www.') or host.startswith('m.'):
+            host = host.split('.', 1)[1]
+        
+        query = sorted(
+            (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+            if key.lower() not in TRACKING_PARAMS and not key.lower().startswith('utm_')
+        )
+        path = parsed.path.rstrip('/') or '/'
+        return urlunparse(((parsed.scheme or 'https').lower(), host, path, '', urlencode(query), ''))
+    except Exception as e:
+        print(f"❌ Error normalizing URL: {e}")
+        return url
+
+def media_cache_key(url, options=None):
+    """Cache key: normalized URL plus the yt-dlp format selector used for it"""
+    options = options or get_download_options(url)
+    return f"{normalize_url(url)}|{options.get('format', '')}"
+
+class MediaCache:
+    """
+    URL -> uploaded file_id cache so repeated links are answered without
+    downloading or uploading again. An in-process LRU sits in front of the
+    media_cache collection; both honour the same TTL.
+    Entries look like {'file_ids': [...], 'chat_id', 'message_ids', 'title', 'file_size'}.
+    """
+    
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (entry, monotonic expiry)
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+    
+    def _remember(self, key, entry, ttl):
+        self._entries[key] = (entry, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def _count(self, field):
+        from database import increment_stats
+        asyncio.ensure_future(increment_stats(field))
+    
+    async def get(self, url, options=None):
+        """Cached entry for a URL, or None"""
+        from database import get_cached_media
+        
+        key = media_cache_key(url, options)
+        cached = self._entries.get(key)
+        if cached:
+            entry, expires = cached
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                self._count('media_cache_hits')
+                return entry
+            del self._entries[key]
+        
+        entry = await get_cached_media(key)
+        if entry:
+            remaining = (entry['expires_at'] - datetime.utcnow()).total_seconds()
+            self._remember(key, entry, remaining)
+            self.hits += 1
+            self._count('media_cache_hits')
+            return entry
+        
+        self.misses += 1
+        self._count('media_cache_misses')
+        return None
+    
+    async def put(self, url, entry, options=None):
+        """Remember the uploaded file_ids for a URL"""
+        from database import store_cached_media
+        
+        key = media_cache_key(url, options)
+        self._remember(key, entry, self.ttl)
+        return await store_cached_media(key, entry, self.ttl)
+    
+    async def invalidate(self, url, options=None):
+        """Forget a URL, e.g. after its cached file_id was rejected"""
+        from database import remove_cached_media
+        
+        key = media_cache_key(url, options)
+        self._entries.pop(key, None)
+        return await remove_cached_media(key)
+    
+    def stats(self):
+        """Hit/miss counters since startup"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'memory_hits': self.memory_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._entries)
+        }
+
+media_file_cache = MediaCache(Config.MEDIA_CACHE_TTL, Config.MEDIA_CACHE_MAX_ENTRIES)
+
+
+# ==================== CONTENT DEDUPLICATION ====================
+
+# Bytes covered by the cheap prefix fingerprint
+CONTENT_PREFIX_SIZE = 1024 * 1024
+
+class ContentHasher:
+    """
+    Incremental fingerprint of data as it is written: full SHA-256 plus a
+    quick key (size + hash of the first CONTENT_PREFIX_SIZE bytes).
+    Feeding it the chunks being written avoids re-reading multi-GB files.
+    """
+    
+    def __init__(self):
+        self._full = hashlib.sha256()
+        self._prefix = hashlib.sha256()
+        self.size = 0
+    
+    def update(self, chunk):
+        if self.size < CONTENT_PREFIX_SIZE:
+            self._prefix.update(chunk[:CONTENT_PREFIX_SIZE - self.size])
+        self._full.update(chunk)
+        self.size += len(chunk)
+    
+    @property
+    def prefix_complete(self):
+        return self.size >= CONTENT_PREFIX_SIZE
+    
+    def quick_key(self, total_size=None):
+        """Size + prefix hash; pass the expected size to check before the write finishes"""
+        return f"{total_size if total_size is not None else self.size}:{self._prefix.hexdigest()}"
+    
+    def fingerprint(self):
+        return {'sha256': self._full.hexdigest(), 'quick_key': self.quick_key(), 'size': self.size}
+
+class HashingWriter:
+    """Async file writer for DOWNLOAD_DIR that fingerprints everything it writes"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.hasher = ContentHasher()
+        self._file = None
+    
+    async def __aenter__(self):
+        self._file = await aiofiles.open(self.path, 'wb')
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._file.close()
+    
+    async def write(self, chunk):
+        self.hasher.update(chunk)
+        await self._file.write(chunk)
+    
+    def fingerprint(self):
+        return self.hasher.fingerprint()
+
+async def write_and_fingerprint(chunks, path):
+    """Write an async iterable of byte chunks to `path`, returning its fingerprint"""
+    async with HashingWriter(path) as writer:
+        async for chunk in chunks:
+            await writer.write(chunk)
+    return writer.fingerprint()
+
+async def may_be_duplicate(hasher, expected_size):
+    """
+    Early check while a download with a known size (Content-Length) is still
+    being written: once the prefix is hashed, a miss on the quick key proves
+    the content is new; a hit means the full hash is worth comparing.
+    """
+    from database import has_content_candidate
+    
+    if not expected_size or not hasher.prefix_complete:
+        return True
+    return await has_content_candidate(hasher.quick_key(expected_size))
+
+async def find_duplicate_upload(fingerprint):
+    """Stored entry (with file_ids) when this exact content was uploaded before"""
+    from database import find_content
+    
+    try:
+        return await find_content(fingerprint['sha256'])
+    except Exception as e:
+        print(f"❌ Error checking for duplicate upload: {e}")
+        return None
+
+async def remember_upload(fingerprint, entry):
+    """Index an upload so later downloads of the same content reuse its file_ids"""
+    from database import store_content
+    return await store_content(fingerprint, entry)
+
+
+# ==================== PIPELINED DOWNLOAD + UPLOAD ====================
+
+# Telegram upload part size (512 KiB is the maximum)
+PIPELINE_PART_SIZE = 512 * 1024
+# upload.SaveBigFilePart accepts at most 4000 parts, i.e. 2000 MiB at 512 KiB
+PIPELINE_MAX_PARTS = 4000
+# Files above this size must be uploaded with SaveBigFilePart
+BIG_FILE_THRESHOLD = 10 * 1024 * 1024
+
+def _extract_progressive_format(url, options):
+    """Blocking yt-dlp lookup of a single-file (progressive HTTP) format"""
+    import yt_dlp
+    
+    with yt_dlp.YoutubeDL({**options, 'quiet': True, 'no_warnings': True}) as ydl:
+        info = ydl.extract_info(url, download=False)
+    
+    # Merged video+audio or fragmented (HLS/DASH) formats can't be streamed as one file
+    if info.get('requested_formats') or info.get('protocol') not in ('http', 'https'):
+        return None
+    
+    return {
+        'url': info['url'],
+        'http_headers': info.get('http_headers', {}),
+        'filesize': info.get('filesize') or 0,
+        'ext': info.get('ext', 'mp4'),
+        'title': info.get('title', 'video'),
+        'duration': info.get('duration') or 0,
+        'width': info.get('width') or 0,
+        'height': info.get('height') or 0
+    }
+
+async def resolve_progressive_format(url):
+    """Direct download details when get_download_options picks a progressive format, else None"""
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            metadata_executor, _extract_progressive_format, url, get_download_options(url)
+        )
+    except Exception as e:
+        print(f"❌ Error resolving progressive format: {e}")
+        return None
+
+async def _download_parts(response, queue, hasher, progress_state):
+    """Producer: cut the HTTP body into upload-sized parts and queue them"""
+    index = 0
+    pending = bytearray()
+    async for data in response.content.iter_chunked(256 * 1024):
+        pending += data
+        progress_state['downloaded'] += len(data)
+        while len(pending) >= PIPELINE_PART_SIZE:
+            part = bytes(pending[:PIPELINE_PART_SIZE])
+            del pending[:PIPELINE_PART_SIZE]
+            hasher.update(part)
+            await queue.put((index, part))  # blocks while the buffer is full
+            index += 1
+    if pending:
+        hasher.update(bytes(pending))
+        await queue.put((index, bytes(pending)))
+        index += 1
+    return index
+
+async def _upload_parts(client, queue, file_id, total_parts, is_big, progress_state, progress):
+    """Consumer: upload queued parts as they arrive"""
+    from pyrogram import raw
+    from pyrogram.errors import FloodWait
+    
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        index, part = item
+        
+        if is_big:
+            request = raw.functions.upload.SaveBigFilePart(
+                file_id=file_id, file_part=index, file_total_parts=total_parts, bytes=part
+            )
+        else:
+            request = raw.functions.upload.SaveFilePart(file_id=file_id, file_part=index, bytes=part)
+        
+        # FloodWait waits don't count as attempts (same as forward_with_retry)
+        attempt = 0
+        while True:
+            try:
+                await client.invoke(request)
+                break
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+            except Exception as e:
+                attempt += 1
+                if attempt >= Config.SEND_MAX_RETRIES:
+                    raise
+                print(f"⚠️ Upload of part {index} failed ({e}), retrying")
+                await asyncio.sleep(Config.SEND_RETRY_BASE_DELAY * (2 ** attempt))
+        
+        progress_state['uploaded'] += len(part)
+        if progress is not None:
+            await progress(progress_state['uploaded'], progress_state['total'])
+
+async def pipelined_download_upload(client, url, chat_id, caption="", progress=None):
+    """
+    Stream a progressive-format URL straight into a Telegram upload.
+    Parts are uploaded while the rest is still downloading, with at most
+    Config.PIPELINE_BUFFER_PARTS parts buffered in between, so latency is
+    close to max(download, upload) instead of their sum. Nothing is written
+    to DOWNLOAD_DIR.
+    Returns (message, fingerprint), or None when the URL needs the regular
+    download path (fragmented/merged format, unknown size or over the limit).
+    """
+    import aiohttp
+    import mimetypes
+    from pyrogram import raw, types, utils
+    
+    try:
+        fmt = await resolve_progressive_format(url)
+        if not fmt:
+            return None
+        
+        # No total timeout: the bounded queue paces the download to the upload,
+        # so only a stalled connection should abort the transfer
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=Config.PIPELINE_READ_TIMEOUT)
+        async with aiohttp.ClientSession(headers=fmt['http_headers'], timeout=timeout) as session:
+            async with session.get(fmt['url']) as response:
+                response.raise_for_status()
+                
+                # The part count must be known before the first part is sent
+                file_size = response.content_length or 0
+                # MAX_FILE_SIZE (2 GiB) would need 4096 parts, which Telegram rejects
+                max_size = min(Config.MAX_FILE_SIZE, PIPELINE_MAX_PARTS * PIPELINE_PART_SIZE)
+                if not file_size or file_size > max_size:
+                    return None
+                
+                file_name = sanitize_filename(f"{fmt['title']}.{fmt['ext']}")
+                file_id = client.rnd_id()
+                is_big = file_size > BIG_FILE_THRESHOLD
+                total_parts = math.ceil(file_size / PIPELINE_PART_SIZE)
+                
+                queue = asyncio.Queue(maxsize=Config.PIPELINE_BUFFER_PARTS)
+                hasher = ContentHasher()
+                progress_state = {'downloaded': 0, 'uploaded': 0, 'total': file_size}
+                started = time.monotonic()
+                
+                uploaders = [
+                    asyncio.ensure_future(_upload_parts(
+                        client, queue, file_id, total_parts, is_big, progress_state, progress
+                    ))
+                    for _ in range(Config.PIPELINE_UPLOAD_WORKERS)
+                ]
+                
+                async def produce():
+                    count = await _download_parts(response, queue, hasher, progress_state)
+                    for _ in uploaders:
+                        await queue.put(None)
+                    return count
+                
+                producer = asyncio.ensure_future(produce())
+                tasks = [producer, *uploaders]
+                try:
+                    # A failed uploader must not leave the producer blocked on a full buffer
+                    await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+                    for task in tasks:
+                        if task.done() and task.exception():
+                            raise task.exception()
+                    sent_parts = producer.result()
+                finally:
+                    for task in tasks:
+                        task.cancel()
+        
+        if sent_parts != total_parts:
+            print(f"❌ Pipelined download size mismatch: {sent_parts}/{total_parts} parts")
+            return None
+        
+        if is_big:
+            input_file = raw.types.InputFileBig(id=file_id, parts=total_parts, name=file_name)
+        else:
+            input_file = raw.types.InputFile(id=file_id, parts=total_parts, name=file_name, md5_checksum="")
+        
+        attributes = [raw.types.DocumentAttributeFilename(file_name=file_name)]
+        mime_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+        if mime_type.startswith("video/"):
+            attributes.append(raw.types.DocumentAttributeVideo(
+                duration=int(fmt['duration']), w=fmt['width'], h=fmt['height'], supports_streaming=True
+            ))
+        
+        result = await client.invoke(raw.functions.messages.SendMedia(
+            peer=await client.resolve_peer(chat_id),
+            media=raw.types.InputMediaUploadedDocument(
+                mime_type=mime_type, file=input_file, attributes=attributes
+            ),
+            random_id=client.rnd_id(),
+            **await utils.parse_text_entities(client, caption, None, None)
+        ))
+        
+        print(f"✅ Pipelined {format_bytes(file_size)} in {time.monotonic() - started:.1f}s")
+        
+        for update in result.updates:
+            if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+                message = await types.Message._parse(
+                    client, update.message,
+                    {user.id: user for user in result.users},
+                    {chat.id: chat for chat in result.chats}
+                )
+                return message, hasher.fingerprint()
+        return None
+    
+    except Exception as e:
+        print(f"❌ Error in pipelined download/upload: {e}")
+        return None
+
+
 # ==================== VALIDATION AND SECURITY ====================
 
 def sanitize_filename(filename):
@@ -64,6 +64,14 @@ class Bot(Client):
         print(f"🚀 Started {bot_info.first_name} (@{bot_info.username})")
         
         self.set_parse_mode(ParseMode.HTML)
+        
+        # Resolve target chats first so the first delivery doesn't pay for it
+        from commands.download import init_scheduler, warm_up_peers
+        self.peer_warmup = await warm_up_peers(self)
+        
+        # Scheduler bootstrap returns quickly; overdue posts drain in the background
+        await init_scheduler(self)
+        
         await self._send_startup_notification()
         
         print("🎉 Bot is now fully operational!")
@@ -74,9 +82,13 @@ class Bot(Client):
             return
             
         try:
+            warmup = self.peer_warmup
+            failed = len(warmup['failed'])
             message = (
                 f"<b>🚀 Bot Started Successfully!</b>\n\n"
                 f"⏰ <i>Started:</i> {self.uptime.strftime('%Y-%m-%d %H:%M:%S IST')}\n"
+                f"🔗 <i>Peers warmed up:</i> {warmup['resolved']} in {warmup['duration']:.1f}s"
+                f"{f' ({failed} failed)' if failed else ''}\n"
                 f"😴 <i>Ready to serve...</i>"
             )
             
@@ -162,5 +174,17 @@ def main():
         except Exception as e:
             print(f"❌ Error during cleanup: {e}")
 
+def import_schedule(path):
+    """CLI: bulk-import scheduled posts from a JSONL file without starting the bot"""
+    from commands.download import import_schedule_file
+    
+    stats = asyncio.run(import_schedule_file(path))
+    for error in stats['errors']:
+        print(f"   - {error}")
+    sys.exit(0 if stats['inserted'] or not stats['invalid'] else 1)
+
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) == 3 and sys.argv[1] == "import-schedule":
+        import_schedule(sys.argv[2])
+    else:
+        main()